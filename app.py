@@ -1,17 +1,46 @@
 from fastapi import FastAPI, Request, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, JSONResponse, HTMLResponse, StreamingResponse, FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import RedirectResponse, JSONResponse, HTMLResponse, StreamingResponse, FileResponse, Response
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.requests import Request as StarletteRequest
+from starlette.background import BackgroundTask
 from authlib.integrations.starlette_client import OAuth
 import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from starlette.concurrency import run_in_threadpool
+import httpx
 import os
 import csv
-from io import StringIO, BytesIO
-from datetime import datetime, timedelta, date
+import json
+import base64
+import uuid
+import zlib
+import tempfile
+import hashlib
+import math
+import bisect
+import mimetypes
+import gzip
+import html
+import re
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+import time
+from io import StringIO
+from datetime import datetime, timedelta, date, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from typing import Optional, Tuple, List
 from pathlib import Path
+from urllib.parse import quote
 
 
 
@@ -30,11 +59,285 @@ try:
 except Exception:
     SimpleDocTemplate = None  # type: ignore
 
+# Optional brotli for precompressed static assets
+try:
+    import brotli
+except Exception:
+    brotli = None  # type: ignore
+
 app = FastAPI()
 
-# ==== Mount Static Files ====
-if Path("public").exists():
-    app.mount("/static", StaticFiles(directory="public"), name="static")
+# ==== Metrics (Prometheus) ====
+# GET /metrics serves Prometheus text format. Collection is a dict lookup plus
+# a bisect under a per-metric lock, so it's cheap enough for the hot path and
+# safe from the threadpool where DB calls run.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9)
+
+
+def _format_labels(names: Tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class CounterMetric:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self._values: dict = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for values, value in items:
+            yield f"{self.name}{_format_labels(self.labels, values)} {_format_value(value)}"
+
+
+class GaugeMetric(CounterMetric):
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+
+class CallbackGauge:
+    """Metric read from `fn()` -> {label_values_tuple: value} at scrape time."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], fn, kind: str = "gauge"):
+        self.name, self.help, self.labels, self.fn, self.kind = name, help_text, labels, fn, kind
+
+    def samples(self):
+        for values, value in self.fn().items():
+            yield f"{self.name}{_format_labels(self.labels, values)} {_format_value(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, labels
+        self.buckets = tuple(buckets)
+        self._series: dict = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # per-bucket counts (+Inf last), sum
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(values, list(counts), total) for values, (counts, total) in self._series.items()]
+        for values, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, values)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, values)} {cumulative}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+HTTP_REQUESTS = metrics.register(CounterMetric(
+    "portal_http_requests_total", "HTTP requests by route and status.", ("method", "route", "status")))
+HTTP_LATENCY = metrics.register(Histogram(
+    "portal_http_request_duration_seconds", "Time to the last response byte, by route.", ("method", "route")))
+HTTP_IN_FLIGHT = metrics.register(GaugeMetric(
+    "portal_http_requests_in_flight", "Requests currently being handled."))
+DB_ACQUIRE_LATENCY = metrics.register(Histogram(
+    "portal_db_connection_acquire_seconds", "Wait for a pooled connection, including connecting."))
+DB_QUERY_LATENCY = metrics.register(Histogram(
+    "portal_db_query_duration_seconds", "Time spent in a DB unit of work (query + commit).", ("operation",)))
+EXPORT_LATENCY = metrics.register(Histogram(
+    "portal_export_render_duration_seconds", "Export rendering time by format.", ("format",)))
+EXPORT_BYTES = metrics.register(Histogram(
+    "portal_export_size_bytes", "Rendered export size by format.", ("format",), buckets=SIZE_BUCKETS))
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (works with streaming bodies, no extra task per request)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = ["500"]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # FastAPI's router leaves the matched route in the scope: label by its template
+            route = scope["route"].path if "route" in scope else "unmatched"
+            HTTP_REQUESTS.inc(scope["method"], route, status[0])
+            HTTP_LATENCY.observe(time.perf_counter() - start, scope["method"], route)
+
+
+app.add_middleware(MetricsMiddleware)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# ==== Static Assets (in-memory, precompressed) ====
+# public/ is read once at startup and kept in memory together with gzip (and
+# brotli, if installed) encodings, so the captive portal pages cost no disk I/O
+# and go out compressed with strong ETags. STATIC_RELOAD=true re-reads files
+# whose mtime changed, for development.
+STATIC_DIR = Path(os.getenv("STATIC_DIR", "public"))
+STATIC_RELOAD = os.getenv("STATIC_RELOAD", "false").lower() in ("1", "true", "yes")
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "300"))
+STATIC_MIN_COMPRESS = 256
+
+
+class StaticAsset:
+    __slots__ = ("media_type", "mtime", "cache_control", "bodies", "etags")
+
+    def __init__(self, path: Path):
+        raw = path.read_bytes()
+        self.mtime = path.stat().st_mtime
+        self.media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        # HTML is revalidated on every load (a cheap 304); other assets are cached for a while.
+        self.cache_control = "no-cache" if path.suffix in (".html", ".htm") else f"public, max-age={STATIC_MAX_AGE}"
+        self.bodies = {"identity": raw}
+        if len(raw) >= STATIC_MIN_COMPRESS:
+            gzipped = gzip.compress(raw, compresslevel=9, mtime=0)
+            if len(gzipped) < len(raw):
+                self.bodies["gzip"] = gzipped
+            if brotli is not None:
+                self.bodies["br"] = brotli.compress(raw, quality=11)
+        digest = hashlib.sha1(raw).hexdigest()[:20]
+        self.etags = {
+            encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+            for encoding in self.bodies
+        }
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class StaticAssets:
+    def __init__(self, directory: Path, reload: bool):
+        self.directory = directory
+        self.reload = reload
+        self._assets: dict = {}
+
+    def load(self):
+        assets = {}
+        if self.directory.is_dir():
+            for path in self.directory.rglob("*"):
+                if path.is_file():
+                    assets[path.relative_to(self.directory).as_posix()] = StaticAsset(path)
+        self._assets = assets
+
+    def get(self, name: str) -> Optional[StaticAsset]:
+        asset = self._assets.get(name)
+        if not self.reload:
+            return asset
+        path = self.directory / name
+        if asset is None:
+            # New file in dev mode: rescan, which only ever picks up files inside the directory.
+            self.load()
+            return self._assets.get(name)
+        try:
+            if path.stat().st_mtime != asset.mtime:
+                asset = self._assets[name] = StaticAsset(path)
+        except FileNotFoundError:
+            self._assets.pop(name, None)
+            return None
+        return asset
+
+    def response(self, request: Request, name: str, not_found: str = "<h1>Not found</h1>") -> Response:
+        asset = self.get(name)
+        if asset is None:
+            return HTMLResponse(not_found, status_code=404)
+
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        encoding = next((e for e in ("br", "gzip") if e in asset.bodies and e in accepted), "identity")
+        headers = {"ETag": asset.etags[encoding], "Cache-Control": asset.cache_control, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        if_none_match = request.headers.get("if-none-match", "")
+        if if_none_match:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in tags or tags & set(asset.etags.values()):
+                return Response(status_code=304, headers=headers)
+        return Response(asset.bodies[encoding], media_type=asset.media_type, headers=headers)
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._assets),
+            "bytes": sum(len(a.bodies["identity"]) for a in self._assets.values()),
+            "brotli": brotli is not None,
+            "reload": self.reload,
+        }
+
+
+static_assets = StaticAssets(STATIC_DIR, STATIC_RELOAD)
+
+
+@app.api_route("/static/{name:path}", methods=["GET", "HEAD"])
+async def serve_static(name: str, request: Request):
+    return static_assets.response(request, name)
 
 # ==== Session Middleware ====
 app.add_middleware(SessionMiddleware, secret_key=os.getenv("SECRET_KEY", "super-secret-key"))
@@ -61,6 +364,594 @@ DB_CONFIG = {
 def get_connection():
     return psycopg2.connect(**DB_CONFIG)
 
+logger = logging.getLogger("uvicorn.error")
+
+# ==== Request Tracing ====
+# Each request gets a RequestTrace in a contextvar (it follows DB calls into the
+# threadpool). Pooled connections use TracingCursor, which times execute/fetch
+# per statement. Phases done before the response starts go into a
+# Server-Timing header; the full trace of a slow request, including streamed
+# rendering, is logged. Statements slower than SLOW_QUERY_MS are logged too,
+# and with SLOW_QUERY_EXPLAIN a SELECT is re-run under EXPLAIN (ANALYZE,
+# BUFFERS) on a separate connection in a background thread.
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "false").lower() in ("1", "true", "yes")
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "600"))
+
+
+class RequestTrace:
+    def __init__(self, route: str):
+        self.route = route
+        self.start = time.perf_counter()
+        self.phases: dict = {}
+        self.queries: List[Tuple[str, float]] = []
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float):
+        with self._lock:
+            total, count = self.phases.get(phase, (0.0, 0))
+            self.phases[phase] = (total + seconds, count + 1)
+
+    def add_query(self, sql: str, seconds: float):
+        with self._lock:
+            self.queries.append((sql, seconds))
+
+    def server_timing(self) -> str:
+        with self._lock:
+            phases = list(self.phases.items())
+        parts = [f"{name};dur={total * 1000:.1f};desc=\"{count}x\"" for name, (total, count) in phases]
+        parts.append(f"app;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def summary(self) -> str:
+        with self._lock:
+            phases = ", ".join(f"{name}={total * 1000:.1f}ms/{count}" for name, (total, count) in self.phases.items())
+            queries = len(self.queries)
+        return f"{queries} queries; {phases}"
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("request_trace", default=None)
+
+
+class trace_phase:
+    """`with trace_phase("render"):` adds the block's duration to the current request trace."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+_explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+_explained: dict = {}
+
+
+def _explain_slow_query(sql: str):
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET statement_timeout = '30s'")
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql)
+            plan = "\n".join(row[0] for row in cur.fetchall())
+        logger.warning("EXPLAIN (ANALYZE, BUFFERS) for slow query:\n%s\n%s", sql[:1000], plan)
+    except Exception as e:
+        logger.warning("EXPLAIN of slow query failed: %s", e)
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def _log_slow_query(sql: str, seconds: float):
+    trace = _current_trace.get()
+    logger.warning(
+        "Slow query (%.0f ms%s): %s", seconds * 1000, f", {trace.route}" if trace else "", sql[:1000]
+    )
+    if not SLOW_QUERY_EXPLAIN or not sql.lstrip()[:6].upper() == "SELECT":
+        return
+    # Only plain SELECTs (ANALYZE really runs the statement), and each distinct
+    # statement at most once per SLOW_QUERY_EXPLAIN_INTERVAL.
+    fingerprint = hashlib.sha1(re.sub(r"'[^']*'|\b\d+\b", "?", sql).encode()).hexdigest()
+    now = time.monotonic()
+    if _explained.get(fingerprint, 0) > now:
+        return
+    if len(_explained) > 1000:
+        _explained.clear()
+    _explained[fingerprint] = now + SLOW_QUERY_EXPLAIN_INTERVAL
+    _explain_executor.submit(_explain_slow_query, sql)
+
+
+class TracingCursor(psycopg2.extensions.cursor):
+    """Cursor that times execute and fetch calls into the request trace."""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - start
+            trace = _current_trace.get()
+            if trace is not None or elapsed * 1000 >= SLOW_QUERY_MS:
+                sql = self.query or query
+                sql = sql.decode("utf-8", "replace") if isinstance(sql, bytes) else str(sql)
+                if trace is not None:
+                    trace.add("db-exec", elapsed)
+                    trace.add_query(sql, elapsed)
+                if elapsed * 1000 >= SLOW_QUERY_MS:
+                    _log_slow_query(sql, elapsed)
+
+    def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.add("db-fetch", time.perf_counter() - start)
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware: starts a trace per request and adds Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = RequestTrace(scope["path"])
+        token = _current_trace.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and SERVER_TIMING:
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", trace.server_timing().encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            elapsed_ms = (time.perf_counter() - trace.start) * 1000
+            if elapsed_ms >= SLOW_REQUEST_MS:
+                logger.warning("Slow request %s %s (%.0f ms): %s", scope["method"], scope["path"], elapsed_ms, trace.summary())
+
+
+app.add_middleware(TracingMiddleware)
+
+# ==== Connection Pool ====
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_POOL_SLOW_ACQUIRE = float(os.getenv("DB_POOL_SLOW_ACQUIRE", "0.5"))
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within the acquire timeout."""
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which statements were PREPAREd on it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.cursor_factory = TracingCursor
+
+
+def execute_prepared(cur, name: str, sql: str, params=()):
+    """Execute `sql` as a named server-side prepared statement.
+
+    The statement is PREPAREd the first time a connection sees `name`; after
+    that only EXECUTE and the parameters go over the wire.
+    """
+    conn = cur.connection
+    if name not in conn.prepared:
+        parts = sql.split("%s")
+        text = parts[0] + "".join(f"${i}{part}" for i, part in enumerate(parts[1:], 1))
+        cur.execute(f"PREPARE {name} AS {text}")
+        conn.prepared.add(name)
+    if params:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cur.execute(f"EXECUTE {name}")
+
+
+class DBPool:
+    """Shared psycopg2 connection pool with an awaitable API.
+
+    Connecting, executing and fetching all happen in Starlette's threadpool, so
+    a slow TLS handshake or query never blocks the event loop.
+    """
+
+    def __init__(self, config: dict, minconn: int, maxconn: int, timeout: float):
+        self.config = config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._pool: Optional[ThreadedConnectionPool] = None
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.max_wait = 0.0
+
+    def open(self):
+        if self._pool is None:
+            self._pool = ThreadedConnectionPool(
+                self.minconn, self.maxconn, connection_factory=PooledConnection, **self.config
+            )
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+    def acquire(self):
+        if self._pool is None:
+            raise RuntimeError("Database pool is not open")
+        start = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        try:
+            got_slot = self._slots.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        if not got_slot:
+            with self._lock:
+                self.timeouts += 1
+            logger.warning("DB pool saturated: no connection within %.1fs (%s)", self.timeout, self.stats())
+            raise PoolTimeout(f"No database connection available within {self.timeout}s")
+        try:
+            conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        waited = time.monotonic() - start
+        DB_ACQUIRE_LATENCY.observe(waited)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add("db-connect", waited)
+        with self._lock:
+            self.in_use += 1
+            self.acquired += 1
+            self.max_wait = max(self.max_wait, waited)
+        if waited > DB_POOL_SLOW_ACQUIRE:
+            logger.warning("DB pool acquire took %.2fs (%s)", waited, self.stats())
+        return conn
+
+    def release(self, conn, discard: bool = False):
+        try:
+            self._pool.putconn(conn, close=discard or bool(conn.closed))
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def _call(self, fn, args):
+        conn = self.acquire()
+        discard = False
+        operation = (args[2] or "query") if fn is _run_query else fn.__name__
+        start = time.perf_counter()
+        try:
+            result = fn(conn, *args)
+            conn.commit()
+            DB_QUERY_LATENCY.observe(time.perf_counter() - start, operation)
+            return result
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        except Exception:
+            try:
+                conn.rollback()
+                if conn.prepared:
+                    # PREPAREs issued inside the failed transaction may or may
+                    # not have survived, so start this connection from scratch.
+                    with conn.cursor() as cur:
+                        cur.execute("DEALLOCATE ALL")
+                    conn.commit()
+                    conn.prepared.clear()
+            except psycopg2.Error:
+                discard = True
+            raise
+        finally:
+            self.release(conn, discard)
+
+    async def run(self, fn, *args):
+        """Run `fn(conn, *args)` on a pooled connection in a worker thread.
+
+        The transaction is committed when `fn` returns and rolled back if it raises.
+        """
+        return await run_in_threadpool(self._call, fn, args)
+
+    async def fetchone(self, sql: str, params=None, prepared: Optional[str] = None):
+        return await self.run(_run_query, sql, params, prepared, "one")
+
+    async def fetchall(self, sql: str, params=None, prepared: Optional[str] = None):
+        return await self.run(_run_query, sql, params, prepared, "all")
+
+    async def execute(self, sql: str, params=None, prepared: Optional[str] = None) -> int:
+        return await self.run(_run_query, sql, params, prepared, None)
+
+    async def stream(self, sql: str, params=None, fetch_size: int = 1000):
+        """Yield lists of up to `fetch_size` rows from a named server-side cursor.
+
+        The connection stays checked out until the generator is exhausted or
+        closed, so only one batch of rows is ever held in memory.
+        """
+        conn = await run_in_threadpool(self.acquire)
+        cur = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+        cur.itersize = fetch_size
+        discard = False
+        try:
+            await run_in_threadpool(cur.execute, sql, params)
+            while True:
+                rows = await run_in_threadpool(cur.fetchmany, fetch_size)
+                if not rows:
+                    break
+                yield rows
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            # Shielded so a client disconnect cannot leak the checked-out slot.
+            await asyncio.shield(run_in_threadpool(self._close_stream, conn, cur, discard))
+
+    def _close_stream(self, conn, cur, discard: bool):
+        try:
+            if not discard:
+                cur.close()
+                conn.rollback()
+        except psycopg2.Error:
+            discard = True
+        finally:
+            self.release(conn, discard)
+
+    def stats(self) -> dict:
+        idle = len(self._pool._pool) if self._pool is not None else 0
+        return {
+            "min": self.minconn,
+            "max": self.maxconn,
+            "in_use": self.in_use,
+            "idle": idle,
+            "waiting": self.waiting,
+            "saturation": round(self.in_use / self.maxconn, 3),
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
+
+
+def _run_query(conn, sql, params, prepared, fetch):
+    with conn.cursor() as cur:
+        if prepared:
+            execute_prepared(cur, prepared, sql, params or ())
+        else:
+            cur.execute(sql, params)
+        if fetch == "one":
+            return cur.fetchone()
+        if fetch == "all":
+            return cur.fetchall()
+        return cur.rowcount
+
+
+db = DBPool(DB_CONFIG, DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT)
+
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return JSONResponse(
+        {"success": False, "message": "Database busy, please retry"},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+
+# ==== Read Replica Routing ====
+# Optional streaming replica for the read-only paths (admin list, stats,
+# dashboard, exports). Each path says how stale its data may be; the router
+# sends it to the replica only while the measured replay lag is within that
+# tolerance and falls back to the primary when the replica is lagging or down.
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST")
+REPLICA_CONFIG = {
+    "dbname": os.getenv("DB_REPLICA_NAME", DB_CONFIG["dbname"]),
+    "user": os.getenv("DB_REPLICA_USER", DB_CONFIG["user"]),
+    "password": os.getenv("DB_REPLICA_PASSWORD", DB_CONFIG["password"]),
+    "host": DB_REPLICA_HOST,
+    "port": int(os.getenv("DB_REPLICA_PORT", str(DB_CONFIG["port"]))),
+    "sslmode": os.getenv("DB_REPLICA_SSLMODE", DB_CONFIG["sslmode"]),
+} if DB_REPLICA_HOST else None
+DB_REPLICA_POOL_MAX = int(os.getenv("DB_REPLICA_POOL_MAX", str(DB_POOL_MAX)))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "2"))
+REPLICA_RETRY_INTERVAL = float(os.getenv("REPLICA_RETRY_INTERVAL", "15"))
+# Seconds of replication lag each read path tolerates; 0 pins it to the primary.
+REPLICA_STALENESS = {
+    "users": float(os.getenv("REPLICA_STALENESS_USERS", "5")),
+    "stats": float(os.getenv("REPLICA_STALENESS_STATS", "10")),
+    "dashboard": float(os.getenv("REPLICA_STALENESS_DASHBOARD", "30")),
+    "export": float(os.getenv("REPLICA_STALENESS_EXPORT", "60")),
+}
+
+_REPLICA_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+# Staleness budget of the last replica read in this task, so caches layered on
+# top (ReadCache) don't keep replica results longer than the read allowed.
+_replica_budget: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("replica_budget", default=None)
+
+
+def _replica_lag(conn) -> Optional[float]:
+    """Seconds the replica is behind the primary (0 when fully replayed).
+
+    None when the WAL receiver isn't streaming: received == replayed then only
+    means "caught up with what arrived before the connection dropped".
+    Without pg_read_all_stats the receiver's status reads as NULL, so a
+    running receiver process (pid) is taken as streaming.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT pg_is_in_recovery(),
+                   EXISTS (
+                       SELECT 1 FROM pg_stat_wal_receiver
+                       WHERE status = 'streaming' OR (status IS NULL AND pid IS NOT NULL)
+                   ),
+                   CASE
+                       WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                       ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 'Infinity')
+                   END
+        """)
+        in_recovery, streaming, lag = cur.fetchone()
+        if not in_recovery:
+            return 0.0
+        return float(lag) if streaming else None
+
+
+class ReadRouter:
+    """Picks the primary or replica pool for a read with a staleness budget.
+
+    Lag is sampled at most every REPLICA_LAG_CHECK_INTERVAL seconds. A
+    connection error takes the replica out of rotation for
+    REPLICA_RETRY_INTERVAL seconds; the read that hit it is retried on the
+    primary. Pool timeouts are not retried, they mean the app is overloaded.
+    """
+
+    def __init__(self, primary: DBPool, replica: Optional[DBPool]):
+        self.primary = primary
+        self.replica = replica
+        self.lag: Optional[float] = None
+        self._checked_at = 0.0
+        self._down_until = 0.0
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.fallbacks = 0
+
+    def open(self):
+        if self.replica is None:
+            return
+        try:
+            self.replica.open()
+        except _REPLICA_ERRORS as e:
+            self.mark_down(e)
+
+    def close(self):
+        if self.replica is not None:
+            self.replica.close()
+
+    def mark_down(self, error):
+        self.lag = None
+        self._down_until = time.monotonic() + REPLICA_RETRY_INTERVAL
+        logger.warning("Read replica unavailable, using primary for %.0fs: %s", REPLICA_RETRY_INTERVAL, error)
+
+    async def _check_lag(self):
+        self._checked_at = time.monotonic()
+        try:
+            if self.replica._pool is None:
+                await run_in_threadpool(self.replica.open)
+            lag = await self.replica.run(_replica_lag)
+        except _REPLICA_ERRORS as e:
+            self.mark_down(e)
+            return
+        except PoolTimeout:
+            # Saturated but alive; keep the last known lag.
+            return
+        if lag is None:
+            self.mark_down("WAL receiver is not streaming from the primary")
+        else:
+            self.lag = lag
+
+    async def choose(self, max_staleness: float) -> DBPool:
+        """Return the pool a read tolerating `max_staleness` seconds should use."""
+        pool = self.primary
+        now = time.monotonic()
+        if self.replica is not None and max_staleness > 0 and now >= self._down_until:
+            if now - self._checked_at >= REPLICA_LAG_CHECK_INTERVAL:
+                await self._check_lag()
+            if self.lag is not None and self.lag <= max_staleness:
+                pool = self.replica
+        if pool is self.replica:
+            self.replica_reads += 1
+            _replica_budget.set(max_staleness)
+        else:
+            self.primary_reads += 1
+        return pool
+
+    async def run_with_source(self, max_staleness: float, fn, *args) -> Tuple[DBPool, object]:
+        """Like `run`, but also returns the pool that answered."""
+        pool = await self.choose(max_staleness)
+        if pool is not self.primary:
+            try:
+                return pool, await pool.run(fn, *args)
+            except _REPLICA_ERRORS as e:
+                self.mark_down(e)
+                self.fallbacks += 1
+        return self.primary, await self.primary.run(fn, *args)
+
+    async def run(self, max_staleness: float, fn, *args):
+        return (await self.run_with_source(max_staleness, fn, *args))[1]
+
+    async def stream(self, source: DBPool, sql: str, params=None, fetch_size: int = 1000):
+        """`source.stream(...)`, restarted on the primary if a replica fails before the first batch."""
+        started = False
+        try:
+            async for rows in source.stream(sql, params, fetch_size):
+                started = True
+                yield rows
+            return
+        except _REPLICA_ERRORS as e:
+            if source is self.primary or started:
+                raise
+            self.mark_down(e)
+            self.fallbacks += 1
+        async for rows in self.primary.stream(sql, params, fetch_size):
+            yield rows
+
+    async def fetchone(self, max_staleness: float, sql: str, params=None):
+        return await self.run(max_staleness, _run_query, sql, params, None, "one")
+
+    async def fetchall(self, max_staleness: float, sql: str, params=None):
+        return await self.run(max_staleness, _run_query, sql, params, None, "all")
+
+    def stats(self) -> dict:
+        if self.replica is None:
+            return {"configured": False}
+        return {
+            "configured": True,
+            "available": time.monotonic() >= self._down_until,
+            "lag_s": None if self.lag is None else round(self.lag, 3),
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "fallbacks": self.fallbacks,
+            "pool": self.replica.stats(),
+        }
+
+
+replica_db = DBPool(REPLICA_CONFIG, 0, DB_REPLICA_POOL_MAX, DB_POOL_TIMEOUT) if REPLICA_CONFIG else None
+reads = ReadRouter(db, replica_db)
+
 DASHBOARD_PASSWORD = os.getenv("DASHBOARD_PASSWORD", "Bali0361")
 
 # ==== URL Aplikasi ====
@@ -76,20 +967,530 @@ DST_URL = os.getenv("DST_URL", "https://nuanu.com/")
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 
+GOOGLE_DISCOVERY_URL = os.getenv("GOOGLE_DISCOVERY_URL", "https://accounts.google.com/.well-known/openid-configuration")
+
 oauth = OAuth()
 oauth.register(
     name="google",
     client_id=GOOGLE_CLIENT_ID,
     client_secret=GOOGLE_CLIENT_SECRET,
-    server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
+    server_metadata_url=GOOGLE_DISCOVERY_URL,
     client_kwargs={"scope": "openid email profile"},
 )
 
-# ==== DB Init ====
-def init_db():
-    conn = get_connection()
-    cur = conn.cursor()
+# ==== Google OIDC Metadata Prewarm ====
+# authlib fetches the discovery document and JWKS lazily on the first login.
+# Load both at startup instead (from a disk cache younger than OIDC_CACHE_TTL,
+# else from the network) and refresh them in the background, so the login path
+# always reads them from memory. authlib still refetches the JWKS by itself if
+# an id_token is signed with a key it doesn't know yet.
+OIDC_CACHE_FILE = Path(os.getenv("OIDC_CACHE_FILE", ".oidc_cache.json"))
+OIDC_CACHE_TTL = float(os.getenv("OIDC_CACHE_TTL", "86400"))
+OIDC_REFRESH_INTERVAL = float(os.getenv("OIDC_REFRESH_INTERVAL", "3600"))
+OIDC_FETCH_TIMEOUT = float(os.getenv("OIDC_FETCH_TIMEOUT", "5"))
+
+
+async def _fetch_oidc_metadata(discovery_url: str) -> dict:
+    async with httpx.AsyncClient(timeout=OIDC_FETCH_TIMEOUT) as client:
+        resp = await client.get(discovery_url)
+        resp.raise_for_status()
+        metadata = resp.json()
+        resp = await client.get(metadata["jwks_uri"])
+        resp.raise_for_status()
+        metadata["jwks"] = resp.json()
+    metadata["_loaded_at"] = time.time()
+    return metadata
+
+
+def _read_oidc_cache(cache_file: Path, discovery_url: str) -> Optional[dict]:
+    try:
+        cached = json.loads(cache_file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if cached.get("discovery_url") != discovery_url:
+        return None
+    return cached.get("metadata")
+
+
+def _write_oidc_cache(cache_file: Path, discovery_url: str, metadata: dict):
+    partial = cache_file.with_suffix(".partial")
+    partial.write_text(json.dumps({"discovery_url": discovery_url, "metadata": metadata}), encoding="utf-8")
+    os.replace(partial, cache_file)
+
+
+async def load_oidc_metadata(client=None, discovery_url: str = GOOGLE_DISCOVERY_URL,
+                             cache_file: Path = OIDC_CACHE_FILE, force: bool = False) -> Optional[dict]:
+    """Install discovery metadata + JWKS into `client.server_metadata`.
+
+    Uses the disk cache while it is fresh (unless `force`), otherwise fetches
+    and rewrites it. If the fetch fails, a stale cache is still better than a
+    lazy fetch on the login path. Returns the metadata installed, if any.
+    """
+    client = client or oauth.google
+    cached = await run_in_threadpool(_read_oidc_cache, cache_file, discovery_url)
+    metadata = cached
+    if force or cached is None or time.time() - cached.get("_loaded_at", 0) > OIDC_CACHE_TTL:
+        try:
+            metadata = await _fetch_oidc_metadata(discovery_url)
+            await run_in_threadpool(_write_oidc_cache, cache_file, discovery_url, metadata)
+        except Exception as e:
+            logger.warning("Could not fetch OIDC metadata from %s: %s", discovery_url, e)
+    if metadata:
+        client.server_metadata.update(metadata)
+    return metadata
+
+
+async def _oidc_refresh_loop():
+    while True:
+        await asyncio.sleep(OIDC_REFRESH_INTERVAL)
+        await load_oidc_metadata(force=True)
+
+
+_oidc_refresh_task: Optional[asyncio.Task] = None
+
+# ==== Hourly Rollups ====
+# wifi_users_hourly holds per-hour, per-role counts maintained by statement-level
+# triggers, so /api/stats never has to aggregate the raw table.
+ROLLUP_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS wifi_users_hourly (
+        hour TIMESTAMP NOT NULL,
+        role VARCHAR(100) NOT NULL DEFAULT '',
+        count BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour, role)
+    )
+    """,
+    """
+    CREATE OR REPLACE FUNCTION wifi_users_hourly_add() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO wifi_users_hourly (hour, role, count)
+        SELECT date_trunc('hour', created_at), COALESCE(role, ''), COUNT(*)
+        FROM new_rows
+        WHERE created_at IS NOT NULL
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (hour, role) DO UPDATE SET count = wifi_users_hourly.count + EXCLUDED.count;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION wifi_users_hourly_remove() RETURNS trigger AS $$
+    BEGIN
+        UPDATE wifi_users_hourly h
+        SET count = h.count - d.n
+        FROM (
+            SELECT date_trunc('hour', created_at) AS hour, COALESCE(role, '') AS role, COUNT(*) AS n
+            FROM old_rows
+            WHERE created_at IS NOT NULL
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        ) d
+        WHERE h.hour = d.hour AND h.role = d.role;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'wifi_users_hourly_ins') THEN
+            CREATE TRIGGER wifi_users_hourly_ins AFTER INSERT ON wifi_users
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION wifi_users_hourly_add();
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'wifi_users_hourly_del') THEN
+            CREATE TRIGGER wifi_users_hourly_del AFTER DELETE ON wifi_users
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION wifi_users_hourly_remove();
+        END IF;
+    END
+    $$
+    """,
+]
+
+
+def _backfill_rollups(cur):
+    # First run against an existing table: backfill from the raw rows.
+    cur.execute("SELECT NOT EXISTS (SELECT 1 FROM wifi_users_hourly) AND EXISTS (SELECT 1 FROM wifi_users)")
+    if cur.fetchone()[0]:
+        _rebuild_rollups(cur)
+
+
+def _rebuild_rollups(cur) -> int:
+    """Recompute wifi_users_hourly from wifi_users; returns the number of buckets."""
+    # SHARE mode blocks writers (and so the triggers) while the rollup is rebuilt.
+    cur.execute("LOCK TABLE wifi_users IN SHARE MODE")
+    cur.execute("DELETE FROM wifi_users_hourly")
     cur.execute("""
+        INSERT INTO wifi_users_hourly (hour, role, count)
+        SELECT date_trunc('hour', created_at), COALESCE(role, ''), COUNT(*)
+        FROM wifi_users
+        WHERE created_at IS NOT NULL
+        GROUP BY 1, 2
+    """)
+    return cur.rowcount
+
+
+def rebuild_rollups(conn) -> int:
+    with conn.cursor() as cur:
+        return _rebuild_rollups(cur)
+
+# ==== Unique Visitor Sketches (HyperLogLog) ====
+# wifi_users gets a row per connection, so distinct visitors are estimated from
+# per-day HyperLogLog sketches of email and ip_address instead of COUNT(DISTINCT).
+# With 2**12 registers the standard error is 1.04 / sqrt(4096) ~= 1.6%, i.e.
+# ~95% of estimates fall within +-3.3% of the exact count, whatever the range.
+HLL_P = 12
+HLL_M = 1 << HLL_P
+HLL_ALPHA = 0.7213 / (1 + 1.079 / HLL_M)
+HLL_STANDARD_ERROR = 1.04 / math.sqrt(HLL_M)
+_HLL_MAX_RANK = 64 - HLL_P + 1
+# Byte masks for merging registers as one big integer (ranks are < 128, so the
+# per-byte subtraction below never borrows across bytes).
+_HLL_HIGH_BITS = int.from_bytes(b"\x80" * HLL_M, "big")
+_HLL_ALL_BITS = (1 << (8 * HLL_M)) - 1
+SKETCH_KINDS = ("email", "ip")
+SKETCH_FLUSH_INTERVAL = float(os.getenv("SKETCH_FLUSH_INTERVAL", "30"))
+
+SKETCHES_DDL = """
+CREATE TABLE IF NOT EXISTS wifi_users_daily_sketches (
+    day DATE NOT NULL,
+    kind VARCHAR(10) NOT NULL,
+    registers BYTEA NOT NULL,
+    PRIMARY KEY (day, kind)
+)
+"""
+
+
+class HyperLogLog:
+    """HyperLogLog over 64-bit blake2b hashes with one byte per register."""
+
+    __slots__ = ("registers",)
+
+    def __init__(self, registers: Optional[bytes] = None):
+        self.registers = bytearray(registers) if registers else bytearray(HLL_M)
+
+    def add(self, value: str):
+        x = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        index = x >> (64 - HLL_P)
+        rank = (64 - HLL_P) - (x & ((1 << (64 - HLL_P)) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        """Register-wise max, done SWAR-style on big ints (~40us vs ~1ms per byte)."""
+        x = int.from_bytes(self.registers, "big")
+        y = int.from_bytes(other.registers, "big")
+        x_ge_y = (((x | _HLL_HIGH_BITS) - y) & _HLL_HIGH_BITS) >> 7
+        mask = x_ge_y * 0xFF
+        merged = (x & mask) | (y & ~mask & _HLL_ALL_BITS)
+        self.registers = bytearray(merged.to_bytes(HLL_M, "big"))
+
+    def count(self) -> int:
+        registers = bytes(self.registers)
+        harmonic = sum(registers.count(rank) * 2.0 ** -rank for rank in range(_HLL_MAX_RANK + 1))
+        estimate = HLL_ALPHA * HLL_M * HLL_M / harmonic
+        zeros = registers.count(0)
+        if zeros and estimate <= 2.5 * HLL_M:
+            # Small-range correction (linear counting)
+            return round(HLL_M * math.log(HLL_M / zeros))
+        return round(estimate)
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        return cls(zlib.decompress(bytes(data)))
+
+
+def _sketch_values(email: Optional[str], ip_address: Optional[str]):
+    if email:
+        yield "email", email.strip().lower()
+    if ip_address:
+        yield "ip", ip_address
+
+
+def _merge_sketches(cur, sketches: dict):
+    """Merge {(day, kind): HyperLogLog} into wifi_users_daily_sketches."""
+    # Fixed key order so concurrent flushes from several workers can't deadlock.
+    for (day, kind), sketch in sorted(sketches.items()):
+        cur.execute("""
+            INSERT INTO wifi_users_daily_sketches (day, kind, registers) VALUES (%s, %s, %s)
+            ON CONFLICT (day, kind) DO NOTHING
+            RETURNING day
+        """, (day, kind, psycopg2.Binary(sketch.to_bytes())))
+        if cur.fetchone():
+            continue
+        cur.execute(
+            "SELECT registers FROM wifi_users_daily_sketches WHERE day = %s AND kind = %s FOR UPDATE",
+            (day, kind),
+        )
+        merged = HyperLogLog.from_bytes(cur.fetchone()[0])
+        merged.merge(sketch)
+        cur.execute(
+            "UPDATE wifi_users_daily_sketches SET registers = %s WHERE day = %s AND kind = %s",
+            (psycopg2.Binary(merged.to_bytes()), day, kind),
+        )
+
+
+def _flush_sketches(conn, sketches: dict):
+    with conn.cursor() as cur:
+        _merge_sketches(cur, sketches)
+
+
+def _rebuild_sketches(cur, days: Optional[List[date]] = None) -> int:
+    """Recompute daily sketches from wifi_users (all days, or only `days`); returns the number of sketches."""
+    sketches: dict = {}
+    sql, params = "SELECT created_at::date, email, ip_address FROM wifi_users WHERE created_at IS NOT NULL", ()
+    if days:
+        days = sorted(set(days))
+        # The range lets a partitioned table prune to the months involved.
+        sql += " AND created_at >= %s AND created_at < %s AND created_at::date = ANY(%s)"
+        params = (days[0], days[-1] + timedelta(days=1), days)
+    # Lock before reading: flushes from the running app then either finished
+    # before the scan (their rows are in it) or wait and merge on top after.
+    # Locking after the scan would drop rows flushed in between.
+    cur.execute("LOCK TABLE wifi_users_daily_sketches IN EXCLUSIVE MODE")
+    with cur.connection.cursor(name="rebuild_sketches") as rows:
+        rows.itersize = 10000
+        rows.execute(sql, params)
+        for day, email, ip_address in rows:
+            for kind, value in _sketch_values(email, ip_address):
+                sketches.setdefault((day, kind), HyperLogLog()).add(value)
+    if days:
+        cur.execute("DELETE FROM wifi_users_daily_sketches WHERE day = ANY(%s)", (days,))
+    else:
+        cur.execute("DELETE FROM wifi_users_daily_sketches")
+    _merge_sketches(cur, sketches)
+    return len(sketches)
+
+
+def _backfill_sketches(cur):
+    cur.execute("SELECT NOT EXISTS (SELECT 1 FROM wifi_users_daily_sketches) AND EXISTS (SELECT 1 FROM wifi_users)")
+    if cur.fetchone()[0]:
+        _rebuild_sketches(cur)
+
+
+def rebuild_sketches(conn, days: Optional[List[date]] = None) -> int:
+    with conn.cursor() as cur:
+        return _rebuild_sketches(cur, days)
+
+
+class SketchStore:
+    """Buffers sketch updates for new rows and merges them into the table.
+
+    Pending updates are also merged into reads, so estimates include rows
+    saved since the last flush. Users deleted one at a time stay counted until
+    `python app.py rebuild-sketches`; bulk deletes recompute the days they hit.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending: dict = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def add_rows(self, rows: List[tuple]):
+        """Add (id, email, questions, role, ip_address, created_at) rows."""
+        with self._lock:
+            for row in rows:
+                if row[5] is None:
+                    continue
+                day = row[5].date()
+                for kind, value in _sketch_values(row[1], row[4]):
+                    sketch = self._pending.get((day, kind))
+                    if sketch is None:
+                        sketch = self._pending[(day, kind)] = HyperLogLog()
+                    sketch.add(value)
+
+    def _take_pending(self) -> dict:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def _restore_pending(self, pending: dict):
+        with self._lock:
+            for key, sketch in pending.items():
+                if key in self._pending:
+                    sketch.merge(self._pending[key])
+                self._pending[key] = sketch
+
+    async def flush(self):
+        pending = self._take_pending()
+        if not pending:
+            return
+        try:
+            await db.run(_flush_sketches, pending)
+        except Exception:
+            self._restore_pending(pending)
+            raise
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("Sketch flush failed, will retry: %s", e)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error("Final sketch flush failed; run rebuild-sketches to recover: %s", e)
+
+    def unique_visitors(self, conn, start_day: date, end_day: date) -> dict:
+        merged = {kind: HyperLogLog() for kind in SKETCH_KINDS}
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT kind, registers FROM wifi_users_daily_sketches WHERE day BETWEEN %s AND %s",
+                (start_day, end_day),
+            )
+            for kind, registers in cur.fetchall():
+                merged[kind].merge(HyperLogLog.from_bytes(registers))
+        with self._lock:
+            for (day, kind), sketch in self._pending.items():
+                if start_day <= day <= end_day:
+                    merged[kind].merge(sketch)
+        return {kind: sketch.count() for kind, sketch in merged.items()}
+
+
+sketches = SketchStore(SKETCH_FLUSH_INTERVAL)
+
+# ==== Schema Migrations ====
+# Each migration is (version, name, transactional, steps); a step is SQL text or
+# a callable taking a cursor. Non-transactional migrations run in autocommit
+# mode so indexes can be built CONCURRENTLY without locking live tables.
+MIGRATION_LOCK_ID = 7316001
+MIGRATION_LOCK_POLL_INTERVAL = 1.0
+
+
+def _create_index_concurrently(name: str, ddl: str):
+    def step(cur):
+        table = re.search(r"\bON\s+(\w+)", ddl).group(1)
+        cur.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)", (table,))
+        if cur.fetchone()[0]:
+            _create_partitioned_index(cur, name, ddl, table)
+            return
+        # A failed CONCURRENTLY build leaves an INVALID index behind: drop and retry.
+        cur.execute("""
+            SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+            WHERE c.relname = %s
+        """, (name,))
+        row = cur.fetchone()
+        if row and row[0]:
+            return
+        if row:
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        cur.execute(ddl)
+    return step
+
+
+def _partition_index_name(partition: str, name: str, table: str) -> str:
+    child = f"{partition}_{name[len(table) + 1:] if name.startswith(table + '_') else name}"
+    if len(child) > 63:
+        child = f"{child[:54]}_{hashlib.sha1(child.encode()).hexdigest()[:8]}"
+    return child
+
+
+def _create_partitioned_index(cur, name: str, ddl: str, table: str):
+    """Index a partitioned table without locking all of it for the whole build.
+
+    Partitioned parents can't build CONCURRENTLY, and a plain CREATE INDEX holds
+    SHARE locks on every partition until it finishes. Instead the index is
+    created on the parent alone (ON ONLY, invalid and empty), each partition
+    gets its own CONCURRENTLY build, and those are attached one by one; the
+    parent index turns valid once every partition has one.
+    """
+    create, rest = re.match(r"(CREATE (?:UNIQUE )?INDEX) CONCURRENTLY \w+ ON \w+(.*)", ddl.strip(), re.S).groups()
+    cur.execute(f"{create} IF NOT EXISTS {name} ON ONLY {table}{rest}")
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass ORDER BY c.relname
+    """, (table,))
+    for (partition,) in cur.fetchall():
+        # Skip partitions that already have an index attached to this one
+        cur.execute("""
+            SELECT EXISTS (
+                SELECT 1 FROM pg_inherits i JOIN pg_index x ON x.indexrelid = i.inhrelid
+                WHERE i.inhparent = %s::regclass AND x.indrelid = %s::regclass
+            )
+        """, (name, partition))
+        if cur.fetchone()[0]:
+            continue
+        child = _partition_index_name(partition, name, table)
+        _create_index_concurrently(child, f"{create} CONCURRENTLY {child} ON {partition}{rest}")(cur)
+        cur.execute(f"ALTER INDEX {name} ATTACH PARTITION {child}")
+
+
+def _ensure_trial_emails_unique_email(cur):
+    # trial_emails may predate this app (created by hand) with its own unique
+    # constraint on email; only add one if no single-column unique index exists.
+    cur.execute("""
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = 'trial_emails'::regclass AND i.indisunique AND i.indnatts = 1
+          AND a.attname = 'email'
+    """)
+    if cur.fetchone() is None:
+        _create_index_concurrently(
+            "trial_emails_email_key",
+            "CREATE UNIQUE INDEX CONCURRENTLY trial_emails_email_key ON trial_emails (email)",
+        )(cur)
+
+
+# Search indexes: full-text over questions, trigrams over lower(email) for
+# substring matches. The trigram index is GiST, not GIN, because only GiST can
+# return rows in <-> distance order (see _search_users). pg_trgm is an
+# extension, so it is optional: without it email search falls back to prefix
+# matches on wifi_users_email_prefix_idx.
+SEARCH_TSVECTOR = "to_tsvector('simple', coalesce(questions, ''))"
+
+
+def _search_index_ddl(cur, prefix: str = "wifi_users") -> List[Tuple[str, str]]:
+    """(name, CREATE INDEX CONCURRENTLY ...) for the search indexes that can exist here."""
+    indexes = [(
+        f"{prefix}_questions_fts_idx",
+        f"CREATE INDEX CONCURRENTLY {prefix}_questions_fts_idx ON wifi_users USING gin ({SEARCH_TSVECTOR})",
+    )]
+    cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+    if cur.fetchone()[0]:
+        indexes.append((
+            f"{prefix}_email_trgm_gist_idx",
+            f"CREATE INDEX CONCURRENTLY {prefix}_email_trgm_gist_idx ON wifi_users USING gist (lower(email) gist_trgm_ops)",
+        ))
+    return indexes
+
+
+def create_search_indexes(cur):
+    """Install pg_trgm if we may, then build the search indexes (idempotent)."""
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except psycopg2.Error as e:
+        cur.connection.rollback()
+        logger.warning("pg_trgm unavailable, email search will match prefixes only: %s", e)
+    partitioned = _is_partitioned(cur)
+    prefix = "wifi_users_part" if partitioned else "wifi_users"
+    for name, ddl in _search_index_ddl(cur, prefix):
+        _create_index_concurrently(name, ddl)(cur)
+    # The GIN trigram index from migration 5 is superseded by the GiST one.
+    if partitioned:
+        cur.execute(f"DROP INDEX IF EXISTS {prefix}_email_trgm_idx")
+    else:
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {prefix}_email_trgm_idx")
+
+
+MIGRATIONS = [
+    (1, "create wifi_users and trial_emails", True, [
+        """
         CREATE TABLE IF NOT EXISTS wifi_users (
             id SERIAL PRIMARY KEY,
             email VARCHAR(255) NOT NULL,
@@ -98,82 +1499,1114 @@ def init_db():
             ip_address VARCHAR(50),
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS trial_emails (
+            id SERIAL PRIMARY KEY,
+            email VARCHAR(255) NOT NULL,
+            is_verified BOOLEAN NOT NULL DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "hourly wifi_users rollups", True, ROLLUP_DDL + [_backfill_rollups]),
+    (3, "indexes for dashboard, export, stats and user queries", False, [
+        _ensure_trial_emails_unique_email,
+        _create_index_concurrently(
+            "trial_emails_created_at_email_idx",
+            "CREATE INDEX CONCURRENTLY trial_emails_created_at_email_idx ON trial_emails (created_at, email)",
+        ),
+        _create_index_concurrently(
+            "wifi_users_created_at_id_idx",
+            "CREATE INDEX CONCURRENTLY wifi_users_created_at_id_idx ON wifi_users (created_at, id)",
+        ),
+        _create_index_concurrently(
+            "wifi_users_role_created_at_idx",
+            "CREATE INDEX CONCURRENTLY wifi_users_role_created_at_idx ON wifi_users (role, created_at, id)",
+        ),
+        _create_index_concurrently(
+            "wifi_users_email_prefix_idx",
+            "CREATE INDEX CONCURRENTLY wifi_users_email_prefix_idx ON wifi_users (lower(email) text_pattern_ops)",
+        ),
+    ]),
+    (4, "daily unique-visitor sketches", True, [SKETCHES_DDL, _backfill_sketches]),
+    (5, "search indexes on wifi_users email and questions", False, [create_search_indexes]),
+    (6, "GiST trigram index for distance-ordered email search", False, [create_search_indexes]),
+]
+
+
+def _check_migration_versions(migrations) -> None:
+    # A reused version number would be skipped silently as already applied.
+    versions = [version for version, *_ in migrations]
+    for previous, version in zip(versions, versions[1:]):
+        if version <= previous:
+            raise RuntimeError(f"MIGRATIONS versions must be unique and increasing: {version} follows {previous}")
+
+
+def run_migrations(conn) -> List[int]:
+    """Apply pending MIGRATIONS in order; returns the versions applied."""
+    _check_migration_versions(MIGRATIONS)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
     """)
-    conn.commit()
-    cur.close()
-    conn.close()
+    # Several app instances may start at once; only one migrates at a time.
+    # Poll instead of blocking in pg_advisory_lock: a blocked waiter holds a
+    # snapshot, and CREATE INDEX CONCURRENTLY in the holder waits for it.
+    while True:
+        cur.execute("SELECT pg_try_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        if cur.fetchone()[0]:
+            break
+        logger.info("Waiting for another instance to finish migrations")
+        time.sleep(MIGRATION_LOCK_POLL_INTERVAL)
+    applied_now: List[int] = []
+    try:
+        cur.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cur.fetchall()}
+        for version, name, transactional, steps in MIGRATIONS:
+            if version in applied:
+                continue
+            logger.info("Applying migration %d: %s", version, name)
+            conn.autocommit = not transactional
+            try:
+                for step in steps:
+                    if callable(step):
+                        step(cur)
+                    else:
+                        cur.execute(step)
+                cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                if transactional:
+                    conn.commit()
+            except Exception:
+                if transactional:
+                    conn.rollback()
+                raise
+            finally:
+                conn.autocommit = True
+            applied_now.append(version)
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        cur.close()
+    return applied_now
+
+
+# ==== DB Init ====
+def init_db():
+    conn = get_connection()
+    try:
+        return run_migrations(conn)
+    finally:
+        conn.close()
+
+# ==== wifi_users Partitioning & Retention ====
+# `python app.py partition-wifi-users` converts wifi_users into a table range-
+# partitioned by month on created_at. Once partitioned, a background task keeps
+# PARTITION_MONTHS_AHEAD future partitions created and, when
+# WIFI_USERS_RETENTION_MONTHS > 0, archives older partitions to gzipped CSV in
+# ARCHIVE_DIR before detaching and dropping them.
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+WIFI_USERS_RETENTION_MONTHS = int(os.getenv("WIFI_USERS_RETENTION_MONTHS", "0"))
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", "archive"))
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "21600"))
+
+PARTITIONED_WIFI_USERS_DDL = [
+    """
+    CREATE TABLE wifi_users (
+        id INTEGER NOT NULL DEFAULT nextval('wifi_users_id_seq'),
+        email VARCHAR(255) NOT NULL,
+        questions TEXT,
+        role VARCHAR(100),
+        ip_address VARCHAR(50),
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at)
+    """,
+    "ALTER SEQUENCE wifi_users_id_seq OWNED BY wifi_users.id",
+    "CREATE INDEX wifi_users_part_created_at_id_idx ON wifi_users (created_at, id)",
+    "CREATE INDEX wifi_users_part_role_created_at_idx ON wifi_users (role, created_at, id)",
+    "CREATE INDEX wifi_users_part_email_prefix_idx ON wifi_users (lower(email) text_pattern_ops)",
+]
+
+
+def _month_start(d: date, offset: int = 0) -> date:
+    month = d.year * 12 + d.month - 1 + offset
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def _is_partitioned(cur) -> bool:
+    cur.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'wifi_users'::regclass)")
+    return cur.fetchone()[0]
+
+
+def _partition_bounds(cur) -> List[Tuple[str, Optional[datetime], Optional[datetime]]]:
+    """(name, lower, upper) for each wifi_users partition; None means MINVALUE/MAXVALUE."""
+    cur.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'wifi_users'::regclass
+    """)
+    bounds = []
+    for name, expr in cur.fetchall():
+        match = re.search(r"FROM \((.+?)\) TO \((.+?)\)", expr or "")
+        if not match:
+            continue
+        lower, upper = (
+            None if value in ("MINVALUE", "MAXVALUE") else datetime.fromisoformat(value.strip("'"))
+            for value in match.groups()
+        )
+        bounds.append((name, lower, upper))
+    return bounds
+
+
+def ensure_partitions(cur, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    """Create monthly partitions up to `months_ahead` months past the current one."""
+    bounds = _partition_bounds(cur)
+    uppers = [upper.date() for _, _, upper in bounds if upper is not None]
+    month = max([_month_start(date.today())] + uppers)
+    until = _month_start(date.today(), months_ahead + 1)
+    created = []
+    while month < until:
+        following = _month_start(month, 1)
+        name = f"wifi_users_{month.year}_{month.month:02d}"
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF wifi_users "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+        )
+        created.append(name)
+        month = following
+    return created
+
+
+def partition_wifi_users(conn) -> bool:
+    """Convert wifi_users into a monthly partitioned table.
+
+    The existing table becomes the first partition (everything before next
+    month). Its range CHECK constraint and (id, created_at) unique index are
+    built beforehand without blocking writers; the swap then promotes that
+    index to the table's primary key, so it only holds the exclusive lock for
+    catalog changes. Returns False if already done.
+    """
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        if _is_partitioned(cur):
+            return False
+        boundary = _month_start(date.today(), 1).isoformat()
+        cur.execute("UPDATE wifi_users SET created_at = '1970-01-01' WHERE created_at IS NULL")
+        cur.execute("ALTER TABLE wifi_users DROP CONSTRAINT IF EXISTS wifi_users_legacy_range")
+        cur.execute(
+            "ALTER TABLE wifi_users ADD CONSTRAINT wifi_users_legacy_range "
+            f"CHECK (created_at IS NOT NULL AND created_at < '{boundary}') NOT VALID"
+        )
+        cur.execute("ALTER TABLE wifi_users VALIDATE CONSTRAINT wifi_users_legacy_range")
+        _create_index_concurrently(
+            "wifi_users_legacy_id_created_at_key",
+            "CREATE UNIQUE INDEX CONCURRENTLY wifi_users_legacy_id_created_at_key ON wifi_users (id, created_at)",
+        )(cur)
+
+        conn.autocommit = False
+        try:
+            cur.execute("LOCK TABLE wifi_users IN ACCESS EXCLUSIVE MODE")
+            cur.execute("ALTER TABLE wifi_users ALTER COLUMN created_at SET NOT NULL")
+            # ATTACH only reuses a child index that backs the same kind of
+            # constraint as the parent's PRIMARY KEY (id, created_at).
+            cur.execute(
+                "ALTER TABLE wifi_users DROP CONSTRAINT IF EXISTS wifi_users_pkey, "
+                "ADD CONSTRAINT wifi_users_legacy_pkey PRIMARY KEY USING INDEX wifi_users_legacy_id_created_at_key"
+            )
+            # Transition-table triggers are not allowed on partitions; they move to the parent.
+            cur.execute("DROP TRIGGER IF EXISTS wifi_users_hourly_ins ON wifi_users")
+            cur.execute("DROP TRIGGER IF EXISTS wifi_users_hourly_del ON wifi_users")
+            cur.execute("ALTER TABLE wifi_users RENAME TO wifi_users_legacy")
+            for statement in PARTITIONED_WIFI_USERS_DDL:
+                cur.execute(statement)
+            # Equivalent indexes on the old table are attached, not rebuilt.
+            for _, ddl in _search_index_ddl(cur, "wifi_users_part"):
+                cur.execute(ddl.replace(" CONCURRENTLY", "", 1))
+            cur.execute(
+                f"ALTER TABLE wifi_users ATTACH PARTITION wifi_users_legacy FOR VALUES FROM (MINVALUE) TO ('{boundary}')"
+            )
+            cur.execute(ROLLUP_DDL[-1])
+            ensure_partitions(cur)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return True
+    finally:
+        conn.autocommit = True
+        cur.close()
+
+
+def _archive_partition(cur, name: str) -> Path:
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    target = ARCHIVE_DIR / f"{name}.csv.gz"
+    partial = target.with_suffix(".gz.partial")
+    with gzip.open(partial, "wb") as f:
+        cur.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+    os.replace(partial, target)
+    return target
+
+
+def apply_retention(conn, months: int = WIFI_USERS_RETENTION_MONTHS) -> List[str]:
+    """Archive, detach and drop partitions entirely older than `months` months."""
+    if months <= 0:
+        return []
+    cutoff = datetime.combine(_month_start(date.today(), -months), datetime.min.time())
+    removed = []
+    with conn.cursor() as cur:
+        for name, lower, upper in _partition_bounds(cur):
+            if upper is None or upper > cutoff:
+                continue
+            # Archive first (outside the lock); a crash before the drop just re-archives.
+            path = _archive_partition(cur, name)
+            conn.commit()
+            cur.execute(f"ALTER TABLE wifi_users DETACH PARTITION {name}")
+            # Dropping a partition fires no DELETE triggers, so trim the rollup by hand.
+            if lower is None:
+                cur.execute("DELETE FROM wifi_users_hourly WHERE hour < %s", (upper,))
+            else:
+                cur.execute("DELETE FROM wifi_users_hourly WHERE hour >= %s AND hour < %s", (lower, upper))
+            cur.execute(f"DROP TABLE {name}")
+            conn.commit()
+            logger.info("Archived wifi_users partition %s to %s", name, path)
+            removed.append(name)
+    return removed
+
+
+def run_partition_maintenance() -> dict:
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            if not _is_partitioned(cur):
+                return {"partitioned": False}
+            created = ensure_partitions(cur)
+        conn.commit()
+        return {"partitioned": True, "ensured": created, "archived": apply_retention(conn)}
+    finally:
+        conn.close()
+
+
+async def _partition_maintenance_loop():
+    while True:
+        try:
+            await run_in_threadpool(run_partition_maintenance)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("wifi_users partition maintenance failed: %s", e)
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
+
+_partition_task: Optional[asyncio.Task] = None
+
+# ==== Live Events (SSE) ====
+# /api/events pushes users_added / users_deleted / stats events to open admin
+# pages. Events are fanned out in-process: each message is serialized once and
+# the stats snapshot is recomputed at most once per EVENTS_STATS_DEBOUNCE
+# seconds, no matter how many pages are subscribed.
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+EVENTS_STATS_DEBOUNCE = float(os.getenv("EVENTS_STATS_DEBOUNCE", "1.0"))
+
+
+class EventSubscriber:
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+
+
+class EventHub:
+    """In-process fan-out of change events to SSE subscribers.
+
+    A subscriber whose queue fills up is disconnected rather than allowed to
+    hold back everyone else; EventSource reconnects and the page resyncs.
+    """
+
+    def __init__(self, queue_size: int, stats_debounce: float):
+        self.queue_size = queue_size
+        self.stats_debounce = stats_debounce
+        self._subscribers: set = set()
+        self._stats_task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self) -> EventSubscriber:
+        subscriber = EventSubscriber(self.queue_size)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: EventSubscriber):
+        subscriber.closed = True
+        self._subscribers.discard(subscriber)
+
+    def close(self):
+        """End every open stream (shutdown); a None wakes each waiting generator."""
+        for subscriber in list(self._subscribers):
+            self.unsubscribe(subscriber)
+            try:
+                subscriber.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+
+    def publish(self, event: str, data):
+        if not self._subscribers:
+            return
+        message = f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        self.published += 1
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                self.unsubscribe(subscriber)
+
+    def users_added(self, rows: List[tuple]):
+        """Publish (id, email, questions, role, ip_address, created_at) rows."""
+        self.publish("users_added", [
+            {
+                "id": row[0],
+                "email": row[1],
+                "questions": row[2],
+                "role": row[3],
+                "ip_address": row[4],
+                "created_at": row[5].isoformat() if row[5] else None,
+            }
+            for row in rows
+        ])
+        self.stats_changed()
+
+    def users_deleted(self, ids: List[int]):
+        self.publish("users_deleted", {"ids": ids})
+        self.stats_changed()
+
+    def stats_changed(self):
+        if self._subscribers and (self._stats_task is None or self._stats_task.done()):
+            self._stats_task = asyncio.create_task(self._publish_stats())
+
+    async def _publish_stats(self):
+        await asyncio.sleep(self.stats_debounce)
+        try:
+            payload = await _load_stats()
+        except Exception as e:
+            logger.warning("Could not refresh stats for live events: %s", e)
+            return
+        self.publish("stats", payload["stats"])
+
+    def stats(self) -> dict:
+        return {"subscribers": len(self._subscribers), "published": self.published, "dropped": self.dropped}
+
+
+event_hub = EventHub(EVENTS_QUEUE_SIZE, EVENTS_STATS_DEBOUNCE)
+
+
+@app.get("/api/events")
+async def stream_events():
+    subscriber = event_hub.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not subscriber.closed:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    message = ": ping\n\n"
+                if message is None or subscriber.closed:
+                    break
+                yield message
+        finally:
+            event_hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ==== Batched Ingest (write-behind) ====
+# INGEST_MODE=batched acknowledges guests immediately and writes wifi_users rows
+# in multi-row INSERT batches; INGEST_MODE=direct keeps one INSERT per request.
+# Queued rows keep their arrival time as an aware UTC datetime; the INSERT casts
+# it to timestamptz, so Postgres stores it in its own timezone exactly like the
+# CURRENT_TIMESTAMP default used by direct mode.
+INGEST_MODE = os.getenv("INGEST_MODE", "direct").lower()
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "200"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "1.0"))
+INGEST_MAX_BUFFER = int(os.getenv("INGEST_MAX_BUFFER", "5000"))
+INGEST_PUT_TIMEOUT = float(os.getenv("INGEST_PUT_TIMEOUT", "2"))
+INGEST_FLUSH_RETRIES = int(os.getenv("INGEST_FLUSH_RETRIES", "3"))
+INGEST_SPILL_FILE = Path(os.getenv("INGEST_SPILL_FILE", "ingest_spill.jsonl"))
+INGEST_DEAD_LETTER_FILE = Path(os.getenv("INGEST_DEAD_LETTER_FILE", "ingest_dead_letter.jsonl"))
+
+_INGEST_STOP = object()
+
+
+def _insert_user_batch(conn, rows: List[tuple]) -> List[tuple]:
+    with conn.cursor() as cur:
+        return execute_values(
+            cur,
+            "INSERT INTO wifi_users (email, questions, role, ip_address, created_at) VALUES %s "
+            "RETURNING id, email, questions, role, ip_address, created_at",
+            rows,
+            template="(%s, %s, %s, %s, %s::timestamptz)",
+            page_size=len(rows),
+            fetch=True,
+        )
+
+
+class IngestQueue:
+    """In-memory buffer that flushes wifi_users rows in batches.
+
+    A batch is written when it reaches `batch_size` rows or `interval` seconds
+    after its first row, whichever comes first. When the buffer is full, `put`
+    waits up to `put_timeout` and then reports failure so the caller can shed
+    load. Rows that still cannot be written after the retries are spilled to
+    a JSONL file and replayed on the next startup. A batch rejected for its
+    data is split until the offending rows are isolated; only those go to the
+    dead-letter file, which is never replayed.
+    """
+
+    def __init__(
+        self, batch_size: int, interval: float, max_buffer: int, put_timeout: float, spill_file: Path,
+        dead_letter_file: Path,
+    ):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self.put_timeout = put_timeout
+        self.spill_file = spill_file
+        self.dead_letter_file = dead_letter_file
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.accepted = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.batches = 0
+        self.spilled = 0
+        self.dead_lettered = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_buffer)
+        await self._replay_spill()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop accepting rows and drain everything still buffered."""
+        if self._task is None:
+            return
+        await self._queue.put(_INGEST_STOP)
+        await self._task
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def put(self, row: tuple) -> bool:
+        try:
+            await asyncio.wait_for(self._queue.put(row), timeout=self.put_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._next_batch()
+            if batch:
+                await self._flush(batch)
+
+    async def _next_batch(self) -> Tuple[List[tuple], bool]:
+        loop = asyncio.get_running_loop()
+        item = await self._queue.get()
+        if item is _INGEST_STOP:
+            return self._drain([]), True
+        batch = [item]
+        deadline = loop.time() + self.interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if item is _INGEST_STOP:
+                return self._drain(batch), True
+            batch.append(item)
+        return batch, False
+
+    def _drain(self, batch: List[tuple]) -> List[tuple]:
+        """Add whatever is left behind the stop marker; those guests were already acknowledged."""
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _flush(self, rows: List[tuple]):
+        for start in range(0, len(rows), self.batch_size):
+            await self._write_chunk(rows[start:start + self.batch_size])
+
+    async def _write_chunk(self, chunk: List[tuple]):
+        for attempt in range(1, INGEST_FLUSH_RETRIES + 1):
+            try:
+                inserted = await db.run(_insert_user_batch, chunk)
+            except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                # Retrying won't fix bad data: split the chunk to find the rows at fault.
+                if len(chunk) == 1:
+                    await run_in_threadpool(self._dead_letter, chunk, e)
+                else:
+                    middle = len(chunk) // 2
+                    await self._write_chunk(chunk[:middle])
+                    await self._write_chunk(chunk[middle:])
+                return
+            except Exception as e:
+                logger.warning("Ingest flush of %d rows failed (attempt %d): %s", len(chunk), attempt, e)
+                if attempt < INGEST_FLUSH_RETRIES:
+                    await asyncio.sleep(0.5 * attempt)
+                continue
+            read_cache.invalidate()
+            sketches.add_rows(inserted)
+            event_hub.users_added(inserted)
+            self.flushed += len(chunk)
+            self.batches += 1
+            return
+        await run_in_threadpool(self._spill, chunk)
+
+    @staticmethod
+    def _append_rows(path: Path, rows: List[tuple]):
+        with path.open("a", encoding="utf-8") as f:
+            for email, questions, role, ip_address, created_at in rows:
+                f.write(json.dumps([email, questions, role, ip_address, created_at.isoformat()]) + "\n")
+
+    def _spill(self, rows: List[tuple]):
+        self._append_rows(self.spill_file, rows)
+        self.spilled += len(rows)
+        logger.error("Spilled %d ingest rows to %s", len(rows), self.spill_file)
+
+    def _dead_letter(self, rows: List[tuple], error: Exception):
+        self._append_rows(self.dead_letter_file, rows)
+        self.dead_lettered += len(rows)
+        logger.error("Rejected ingest row written to %s: %s", self.dead_letter_file, error)
+
+    async def _replay_spill(self):
+        if not self.spill_file.exists():
+            return
+        pending = self.spill_file.with_suffix(".replay")
+        self.spill_file.replace(pending)
+        rows = []
+        with pending.open(encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    email, questions, role, ip_address, created_at = json.loads(line)
+                    rows.append((email, questions, role, ip_address, datetime.fromisoformat(created_at)))
+        logger.info("Replaying %d spilled ingest rows", len(rows))
+        await self._flush(rows)
+        pending.unlink()
+
+    def stats(self) -> dict:
+        return {
+            "mode": INGEST_MODE,
+            "buffered": self._queue.qsize() if self._queue is not None else 0,
+            "max_buffer": self.max_buffer,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "spilled": self.spilled,
+            "dead_lettered": self.dead_lettered,
+        }
+
+
+ingest = IngestQueue(
+    INGEST_BATCH_SIZE, INGEST_FLUSH_INTERVAL, INGEST_MAX_BUFFER, INGEST_PUT_TIMEOUT, INGEST_SPILL_FILE,
+    INGEST_DEAD_LETTER_FILE,
+)
+
+@app.on_event("startup")
+async def startup_event():
+    await run_in_threadpool(static_assets.load)
+    await run_in_threadpool(db.open)
+    await run_in_threadpool(reads.open)
+    await run_in_threadpool(init_db)
+    if VERIFIED_EMAIL_CACHE_SIZE > 0:
+        await verified_emails.warm()
+    if INGEST_MODE == "batched":
+        await ingest.start()
+    sketches.start()
+    export_jobs.start()
+    global _prerender_task, _partition_task, _oidc_refresh_task
+    await load_oidc_metadata()
+    if OIDC_REFRESH_INTERVAL > 0:
+        _oidc_refresh_task = asyncio.create_task(_oidc_refresh_loop())
+    if EXPORT_PRERENDER_INTERVAL > 0:
+        _prerender_task = asyncio.create_task(_prerender_loop())
+    if PARTITION_MAINTENANCE_INTERVAL > 0:
+        _partition_task = asyncio.create_task(_partition_maintenance_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # uvicorn only gets here once open responses finish or
+    # --timeout-graceful-shutdown cancels them; end any SSE stream left.
+    event_hub.close()
+    for task in (_prerender_task, _partition_task, _oidc_refresh_task):
+        if task is not None:
+            task.cancel()
+    export_jobs.shutdown()
+    bulk_deletes.shutdown()
+    await ingest.stop()
+    await sketches.stop()
+    await run_in_threadpool(reads.close)
+    await run_in_threadpool(db.close)
 
-@app.on_event("startup")
-def startup_event():
-    init_db()
+# Point-in-time gauges, read at scrape time
+metrics.register(CallbackGauge(
+    "portal_db_pool_connections", "DB pool connections by state.", ("state",),
+    lambda: {("in_use",): db.in_use, ("waiting",): db.waiting, ("max",): db.maxconn},
+))
+metrics.register(CallbackGauge(
+    "portal_db_pool_timeouts_total", "Connection acquisitions that timed out.", (),
+    lambda: {(): db.timeouts}, kind="counter",
+))
+metrics.register(CallbackGauge(
+    "portal_ingest_buffered_rows", "Rows waiting in the batched ingest buffer.", (),
+    lambda: {(): ingest.stats()["buffered"]},
+))
+metrics.register(CallbackGauge(
+    "portal_event_subscribers", "Open /api/events streams.", (),
+    lambda: {(): event_hub.stats()["subscribers"]},
+))
+
+# ==== Health / Pool Saturation ====
+@app.get("/api/health")
+async def health():
+    return JSONResponse({
+        "success": True,
+        "pool": db.stats(),
+        "replica": reads.stats(),
+        "ingest": ingest.stats(),
+        "exports": export_jobs.stats(),
+        "export_cache": export_cache.stats(),
+        "read_cache": read_cache.stats(),
+        "events": event_hub.stats(),
+        "bulk_deletes": bulk_deletes.stats(),
+        "verified_emails": verified_emails.stats(),
+        "static": static_assets.stats(),
+        "admission": admission.stats(),
+        "rate_limits": {"save_user": save_user_limits.stats()},
+    })
 
 # ==== Serve Login Page ====
 @app.get("/", response_class=HTMLResponse)
-async def serve_login():
-    login_file = Path("public/login.html")
-    if login_file.exists():
-        return FileResponse(login_file)
-    return HTMLResponse("<h1>Login page not found</h1>", status_code=404)
+async def serve_login(request: Request):
+    return static_assets.response(request, "login.html", "<h1>Login page not found</h1>")
 
 # ==== Serve Admin Dashboard ====
 @app.get("/admin", response_class=HTMLResponse)
-async def serve_admin():
-    admin_file = Path("public/admin.html")
-    if admin_file.exists():
-        return FileResponse(admin_file)
-    return HTMLResponse("<h1>Admin page not found</h1>", status_code=404)
+async def serve_admin(request: Request):
+    return static_assets.response(request, "admin.html", "<h1>Admin page not found</h1>")
+
+# ==== Admission Control & Rate Limiting ====
+# /api/save-user has a cap on concurrent requests; a request that can't get a
+# slot within ADMISSION_QUEUE_TIMEOUT is shed with 503 + Retry-After instead of
+# piling more work onto the DB. The Google callback is a page navigation that
+# must always end at the hotspot login, so it is never shed.
+#
+# Per-IP token buckets (RATE_LIMIT_BURST requests, refilled at
+# RATE_LIMIT_PER_SECOND, 429 when empty) are off by default: the hotspot
+# masquerades every guest behind the venue's one public IP, so a per-IP limit
+# would throttle the whole venue at once. Only enable them when guests reach
+# the app from distinct addresses (behind a reverse proxy, run uvicorn with
+# --proxy-headers so request.client.host is the client's IP).
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "32"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "0.5"))
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "0"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "10"))
+RATE_LIMIT_MAX_IPS = int(os.getenv("RATE_LIMIT_MAX_IPS", "50000"))
+
+
+class Overloaded(Exception):
+    pass
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limited, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.admitted = 0
+        self.shed = 0
+
+    @asynccontextmanager
+    async def admit(self):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            raise Overloaded()
+        self.active += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "max_concurrent": self.max_concurrent,
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+
+class TokenBuckets:
+    """Per-key token buckets kept in LRU order; a `rate` of 0 disables them.
+
+    A bucket idle long enough to have refilled completely is indistinguishable
+    from a new one, so those are dropped as they age out; `max_keys` bounds
+    memory even under a flood of distinct keys.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        self.enabled = rate > 0
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.idle_expiry = burst / rate if rate > 0 else float("inf")
+        self._buckets: OrderedDict = OrderedDict()
+        self.limited = 0
+
+    def take(self, key: str) -> float:
+        """Consume a token; returns 0 if allowed, else seconds until one is available."""
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            retry_after = 0.0
+        else:
+            self.limited += 1
+            retry_after = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        self._expire(now)
+        return retry_after
+
+    def _expire(self, now: float):
+        while self._buckets:
+            key, (_, updated) = next(iter(self._buckets.items()))
+            if now - updated < self.idle_expiry and len(self._buckets) <= self.max_keys:
+                break
+            self._buckets.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "tracked_ips": len(self._buckets), "limited": self.limited}
+
+
+admission = AdmissionController(ADMISSION_MAX_CONCURRENT, ADMISSION_QUEUE_TIMEOUT)
+save_user_limits = TokenBuckets(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST, RATE_LIMIT_MAX_IPS)
+
+
+def guarded(buckets: TokenBuckets):
+    """Rate-limit an endpoint per client IP and run it under the admission controller."""
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            request = kwargs["request"]
+            retry_after = buckets.take(request.client.host if request.client else "unknown")
+            if retry_after:
+                raise RateLimited(retry_after)
+            async with admission.admit():
+                return await endpoint(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        {"success": False, "message": "Server busy, please retry"},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request: Request, exc: RateLimited):
+    return JSONResponse(
+        {"success": False, "message": "Too many requests, please slow down"},
+        status_code=429,
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
 
 # ==== Save User Data (Email, Questions, Role) ====
 @app.post("/api/save-user")
+@guarded(save_user_limits)
 async def save_user(request: Request):
     data = await request.json()
+    if not isinstance(data, dict):
+        return JSONResponse({"success": False, "message": "Invalid request body"}, status_code=400)
     email = data.get("email")
-    questions = data.get("questions", "")
-    role = data.get("role", "")
+    questions = data.get("questions") or ""
+    role = data.get("role") or ""
     
-    if not email:
+    # Checked here so a bad row can never reach (and fail) a whole ingest batch
+    if not isinstance(email, str) or not email or len(email) > 255:
         return JSONResponse({"success": False, "message": "Invalid email"}, status_code=400)
+    if not isinstance(questions, str) or not isinstance(role, str) or len(role) > 100:
+        return JSONResponse({"success": False, "message": "Invalid questions or role"}, status_code=400)
 
     # Get IP address
     ip_address = request.client.host if request.client else None
 
-    conn = get_connection()
-    cur = conn.cursor()
+    if ingest.running:
+        if await ingest.put((email, questions, role, ip_address, datetime.now(timezone.utc))):
+            return JSONResponse({
+                "success": True,
+                "message": "User data queued",
+                "data": {"id": None, "email": email}
+            })
+        return JSONResponse(
+            {"success": False, "message": "Server busy, please retry"},
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
+
     try:
-        cur.execute("""
+        row = await db.fetchone("""
             INSERT INTO wifi_users (email, questions, role, ip_address)
             VALUES (%s, %s, %s, %s)
-            RETURNING id
-        """, (email, questions, role, ip_address))
-        user_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
+            RETURNING id, email, questions, role, ip_address, created_at
+        """, (email, questions, role, ip_address), prepared="insert_wifi_user")
+        user_id = row[0]
+        read_cache.invalidate()
+        sketches.add_rows([row])
+        event_hub.users_added([row])
         
         return JSONResponse({
             "success": True,
             "message": "User data saved successfully",
             "data": {"id": user_id, "email": email}
         })
+    except PoolTimeout:
+        raise
     except Exception as e:
-        conn.rollback()
-        cur.close()
-        conn.close()
         return JSONResponse({"success": False, "message": str(e)}, status_code=500)
 
+# ==== Read Cache (stats / users) ====
+READ_CACHE_TTL = float(os.getenv("READ_CACHE_TTL", "30"))
+READ_CACHE_MAX_ENTRIES = int(os.getenv("READ_CACHE_MAX_ENTRIES", "256"))
+
+
+class ReadCache:
+    """TTL cache of serialized JSON payloads for the admin read endpoints.
+
+    Every write bumps `version` (the data watermark), which drops all entries
+    and moves Last-Modified. ETags are a digest of the body, so a poll with a
+    matching If-None-Match gets a 304 straight from memory, and still gets
+    one after an invalidation that did not change this payload.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self.version = 0
+        self.changed_at = time.time()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def invalidate(self):
+        self.version += 1
+        self.changed_at = time.time()
+        self._entries.clear()
+
+    async def respond(self, request: Request, compute) -> Response:
+        """Serve `compute()` (a dict payload) through the cache.
+
+        If `compute` returns a Response instead (e.g. a validation error) it is
+        passed through uncached.
+        """
+        key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+        entry = self._entries.get(key)
+        if entry and entry["version"] == self.version and entry["expires"] > time.monotonic():
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.misses += 1
+            version, changed_at = self.version, self.changed_at
+            _replica_budget.set(None)
+            payload = await compute()
+            if isinstance(payload, Response):
+                return payload
+            with trace_phase("serialize"):
+                body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            entry = {
+                "body": body,
+                "etag": f'"{hashlib.sha1(body).hexdigest()[:20]}"',
+                "last_modified": changed_at,
+                "version": version,
+                # A replica read may predate the latest write, so it only lives
+                # as long as that read's staleness budget.
+                "expires": time.monotonic() + min(self.ttl, _replica_budget.get() or self.ttl),
+            }
+            # A write that landed while we were computing makes this entry stale already.
+            if version == self.version:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        headers = {
+            "ETag": entry["etag"],
+            "Last-Modified": formatdate(entry["last_modified"], usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+        if self._not_modified(request, entry):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+    @staticmethod
+    def _not_modified(request: Request, entry: dict) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or entry["etag"] in tags or f"W/{entry['etag']}" in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(entry["last_modified"]) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
+
+
+read_cache = ReadCache(READ_CACHE_TTL, READ_CACHE_MAX_ENTRIES)
+
 # ==== Get All Users (for admin) ====
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", "100"))
+USERS_PAGE_MAX = int(os.getenv("USERS_PAGE_MAX", "500"))
+
+
+def _encode_cursor(created_at: Optional[datetime], key) -> str:
+    raw = f"{created_at.isoformat() if created_at else ''}|{key}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(token: str) -> Tuple[Optional[datetime], str]:
+    """Inverse of _encode_cursor; raises ValueError on a malformed token."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        created_at, key = raw.split("|", 1)
+        return (datetime.fromisoformat(created_at) if created_at else None), key
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
+
+
+def _like_prefix(value: str) -> str:
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
 @app.get("/api/users")
 async def get_users(request: Request):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, email, questions, role, ip_address, created_at
-        FROM wifi_users
-        ORDER BY created_at DESC
-    """)
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    return await read_cache.respond(request, lambda: _load_users(request.query_params))
+
+def _users_filters(qp) -> Tuple[List[str], List]:
+    """WHERE conditions and params for the role/date/email filters; raises ValueError."""
+    conditions: List[str] = []
+    params: List = []
+    if qp.get("role"):
+        conditions.append("role = %s")
+        params.append(qp["role"])
+    if qp.get("start_date"):
+        conditions.append("created_at >= %s")
+        params.append(datetime.strptime(qp["start_date"], "%Y-%m-%d"))
+    if qp.get("end_date"):
+        conditions.append("created_at < %s")
+        params.append(datetime.strptime(qp["end_date"], "%Y-%m-%d") + timedelta(days=1))
+    if qp.get("email"):
+        conditions.append("lower(email) LIKE %s")
+        params.append(_like_prefix(qp["email"].strip().lower()))
+    return conditions, params
+
+
+async def _load_users(qp):
+    try:
+        limit = min(max(int(qp.get("limit", USERS_PAGE_SIZE)), 1), USERS_PAGE_MAX)
+    except ValueError:
+        limit = USERS_PAGE_SIZE
+
+    cursor = None
+    try:
+        conditions, params = _users_filters(qp)
+        if qp.get("cursor"):
+            cursor_at, cursor_id = _decode_cursor(qp["cursor"])
+            cursor = (cursor_at, int(cursor_id))
+    except ValueError as e:
+        return JSONResponse({"success": False, "message": str(e)}, status_code=400)
+
+    # created_at is nullable on an unpartitioned table. Undated rows are listed
+    # last: dated and undated rows are each read in (created_at, id) index
+    # order, so only the two LIMITed parts get sorted together.
+    columns = "id, email, questions, role, ip_address, created_at"
+    parts: List[str] = []
+    part_params: List = []
+    if cursor is None or cursor[0] is not None:
+        dated = conditions + ["created_at IS NOT NULL"]
+        dated_params = list(params)
+        if cursor is not None:
+            dated.append("(created_at, id) < (%s, %s)")
+            dated_params.extend(cursor)
+        parts.append(
+            f"(SELECT {columns} FROM wifi_users WHERE {' AND '.join(dated)} "
+            "ORDER BY created_at DESC, id DESC LIMIT %s)"
+        )
+        part_params.extend([*dated_params, limit + 1])
+    undated = conditions + ["created_at IS NULL"]
+    undated_params = list(params)
+    if cursor is not None and cursor[0] is None:
+        undated.append("id < %s")
+        undated_params.append(cursor[1])
+    parts.append(f"(SELECT {columns} FROM wifi_users WHERE {' AND '.join(undated)} ORDER BY id DESC LIMIT %s)")
+    part_params.extend([*undated_params, limit + 1])
+    rows = await reads.fetchall(REPLICA_STALENESS["users"], f"""
+        {" UNION ALL ".join(parts)}
+        ORDER BY created_at DESC NULLS LAST, id DESC
+        LIMIT %s
+    """, (*part_params, limit + 1))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1][5], rows[-1][0])
     
     users = []
     for row in rows:
@@ -186,72 +2619,520 @@ async def get_users(request: Request):
             "created_at": row[5].isoformat() if row[5] else None
         })
     
-    return JSONResponse({
+    return {
         "success": True,
         "count": len(users),
-        "data": users
-    })
+        "data": users,
+        "next_cursor": next_cursor
+    }
+
+# ==== User Search ====
+# Ranked search over email fragments and words in `questions`, served from the
+# search indexes (see create_search_indexes). Each kind of match (email
+# prefix, email substring, words in questions) contributes at most
+# SEARCH_CANDIDATES rows and only those are ranked. The email branches read
+# them in index order and stop there; a common word in questions still reads
+# its whole GIN posting list, but fetches only SEARCH_CANDIDATES rows.
+SEARCH_MIN_CHARS = int(os.getenv("SEARCH_MIN_CHARS", "3"))
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "20"))
+SEARCH_LIMIT_MAX = int(os.getenv("SEARCH_LIMIT_MAX", "100"))
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "1000"))
+# Private-use characters mark matches in snippets until the text is escaped.
+_MARK_START, _MARK_STOP = "\ue000", "\ue001"
+_HEADLINE_OPTIONS = (
+    f'StartSel="{_MARK_START}", StopSel="{_MARK_STOP}", '
+    'MaxWords=20, MinWords=8, MaxFragments=2, FragmentDelimiter=" … "'
+)
+_search_trgm: Optional[bool] = None
+
+
+def _has_trgm(conn) -> bool:
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+        return cur.fetchone()[0]
+
+
+def _search_users(conn, q: str, tsquery: Optional[str], limit: int, trgm: bool) -> List[tuple]:
+    """Return (id, email, questions, role, ip_address, created_at, rank, snippet) rows."""
+    params = {
+        "q": q,
+        "prefix": _like_prefix(q),
+        "like": "%" + _like_prefix(q),
+        "tsquery": tsquery,
+        "candidates": SEARCH_CANDIDATES,
+        "limit": limit,
+        "headline": _HEADLINE_OPTIONS,
+    }
+    columns = "id, email, questions, role, ip_address, created_at"
+    # Each kind of match is truncated separately, so a common word in
+    # questions can't crowd out exact/prefix emails. Email branches are cut in
+    # an order their index returns directly (no sort over every match): prefix
+    # matches in text_pattern_ops order, where an exact match comes first, and
+    # substring matches by trigram distance from the GiST index.
+    branches = [
+        f"SELECT {columns} FROM wifi_users WHERE lower(email) LIKE %(prefix)s "
+        "ORDER BY lower(email) USING ~<~ LIMIT %(candidates)s"
+    ]
+    score = []
+    if trgm:
+        branches.append(
+            f"SELECT {columns} FROM wifi_users WHERE lower(email) LIKE %(like)s "
+            "ORDER BY lower(email) <-> %(q)s LIMIT %(candidates)s"
+        )
+        score.append("similarity(lower(email), %(q)s)")
+    snippet = "NULL::text"
+    if tsquery:
+        branches.append(
+            f"SELECT {columns} FROM wifi_users WHERE {SEARCH_TSVECTOR} @@ to_tsquery('simple', %(tsquery)s) "
+            "LIMIT %(candidates)s"
+        )
+        score.append(f"ts_rank_cd({SEARCH_TSVECTOR}, to_tsquery('simple', %(tsquery)s))")
+        snippet = "ts_headline('simple', questions, to_tsquery('simple', %(tsquery)s), %(headline)s)"
+    with conn.cursor() as cur:
+        # Exact and prefix email matches always rank first (tier), then by
+        # trigram similarity + text rank. Snippets are built for the final page only.
+        cur.execute(f"""
+            WITH candidates AS (
+                {" UNION ".join(f"({branch})" for branch in branches)}
+            ), ranked AS (
+                SELECT *,
+                       CASE WHEN lower(email) = %(q)s THEN 2 WHEN lower(email) LIKE %(prefix)s THEN 1 ELSE 0 END AS tier,
+                       {" + ".join(score) or "0"} AS score
+                FROM candidates
+                ORDER BY tier DESC, score DESC, created_at DESC NULLS LAST, id DESC
+                LIMIT %(limit)s
+            )
+            SELECT id, email, questions, role, ip_address, created_at, tier + score, {snippet}
+            FROM ranked
+            ORDER BY tier DESC, score DESC, created_at DESC NULLS LAST, id DESC
+        """, params)
+        return cur.fetchall()
+
+
+def _highlight(text: str, q: str) -> str:
+    """HTML-escape `text`, wrapping case-insensitive occurrences of `q` in <mark>."""
+    parts = []
+    lowered, start = text.lower(), 0
+    while True:
+        found = lowered.find(q, start)
+        if found < 0:
+            break
+        parts.append(html.escape(text[start:found]))
+        parts.append(f"<mark>{html.escape(text[found:found + len(q)])}</mark>")
+        start = found + len(q)
+    parts.append(html.escape(text[start:]))
+    return "".join(parts)
+
+
+def _snippet_html(snippet: Optional[str]) -> Optional[str]:
+    if not snippet or _MARK_START not in snippet:
+        return None
+    return html.escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_STOP, "</mark>")
+
+
+@app.get("/api/users/search")
+async def search_users(q: str = "", limit: int = SEARCH_LIMIT):
+    global _search_trgm
+    q = " ".join(q.lower().split())
+    if len(q) < SEARCH_MIN_CHARS:
+        return JSONResponse(
+            {"success": False, "message": f"Search needs at least {SEARCH_MIN_CHARS} characters"}, status_code=400
+        )
+    limit = min(max(limit, 1), SEARCH_LIMIT_MAX)
+    # Words become prefix terms, so "invest" also finds "investor"
+    words = re.findall(r"[^\W_]+", q)
+    tsquery = " & ".join(f"{word}:*" for word in words) or None
+
+    if _search_trgm is None:
+        _search_trgm = await reads.run(REPLICA_STALENESS["users"], _has_trgm)
+    rows = await reads.run(REPLICA_STALENESS["users"], _search_users, q, tsquery, limit, _search_trgm)
+
+    results = []
+    for row in rows:
+        results.append({
+            "id": row[0],
+            "email": row[1],
+            "questions": row[2],
+            "role": row[3],
+            "ip_address": row[4],
+            "created_at": row[5].isoformat() if row[5] else None,
+            "rank": round(float(row[6]), 4),
+            "email_html": _highlight(row[1], q),
+            "questions_html": _snippet_html(row[7]),
+        })
+    return JSONResponse({"success": True, "query": q, "count": len(results), "data": results})
 
 # ==== Get Statistics ====
-@app.get("/api/stats")
-async def get_stats(request: Request):
-    conn = get_connection()
+def _fetch_stats(conn):
     cur = conn.cursor()
     
     # Total users
-    cur.execute("SELECT COUNT(*) FROM wifi_users")
+    cur.execute("SELECT COALESCE(SUM(count), 0)::BIGINT FROM wifi_users_hourly")
     total = cur.fetchone()[0]
     
-    # Last 24 hours
-    cur.execute("SELECT COUNT(*) FROM wifi_users WHERE created_at > NOW() - INTERVAL '24 hours'")
-    last24h = cur.fetchone()[0]
+    # Last 24 hours: whole hours from the rollup, the partial oldest hour from the raw table
+    cur.execute("""
+        WITH w AS (
+            SELECT NOW() - INTERVAL '24 hours' AS since,
+                   date_trunc('hour', NOW() - INTERVAL '24 hours') + INTERVAL '1 hour' AS first_full_hour
+        )
+        SELECT
+            (SELECT COALESCE(SUM(count), 0) FROM wifi_users_hourly, w WHERE hour >= w.first_full_hour)
+          + (SELECT COUNT(*) FROM wifi_users, w WHERE created_at > w.since AND created_at < w.first_full_hour)
+    """)
+    last24h = int(cur.fetchone()[0])
     
     # By role
     cur.execute("""
-        SELECT role, COUNT(*) as count
-        FROM wifi_users
-        WHERE role IS NOT NULL AND role != ''
+        SELECT role, SUM(count)::BIGINT as count
+        FROM wifi_users_hourly
+        WHERE role != ''
         GROUP BY role
+        HAVING SUM(count) > 0
         ORDER BY count DESC
     """)
     role_rows = cur.fetchall()
-    
     cur.close()
-    conn.close()
+    return total, last24h, role_rows
+
+@app.get("/api/stats")
+async def get_stats(request: Request):
+    return await read_cache.respond(request, _load_stats)
+
+async def _load_stats():
+    total, last24h, role_rows = await reads.run(REPLICA_STALENESS["stats"], _fetch_stats)
     
     by_role = [{"role": r[0], "count": r[1]} for r in role_rows]
     
-    return JSONResponse({
+    return {
         "success": True,
         "stats": {
             "total": total,
             "last24hours": last24h,
             "byRole": by_role
         }
+    }
+
+# ==== Unique Visitors ====
+@app.get("/api/unique-visitors")
+async def get_unique_visitors(start_date: Optional[str] = None, end_date: Optional[str] = None):
+    """Estimated distinct emails and IPs between two dates (inclusive, default last 30 days)."""
+    try:
+        end_day = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else date.today()
+        start_day = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else end_day - timedelta(days=29)
+    except ValueError as e:
+        return JSONResponse({"success": False, "message": str(e)}, status_code=400)
+    if start_day > end_day:
+        return JSONResponse({"success": False, "message": "start_date is after end_date"}, status_code=400)
+
+    counts = await reads.run(REPLICA_STALENESS["stats"], sketches.unique_visitors, start_day, end_day)
+    return JSONResponse({
+        "success": True,
+        "start_date": start_day.isoformat(),
+        "end_date": end_day.isoformat(),
+        "unique_emails": counts["email"],
+        "unique_ips": counts["ip"],
+        "relative_error": round(HLL_STANDARD_ERROR, 4),
     })
 
 # ==== Delete User ====
 @app.delete("/api/users/{user_id}")
 async def delete_user(user_id: int, request: Request):
-    conn = get_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("DELETE FROM wifi_users WHERE id = %s RETURNING id", (user_id,))
-        deleted = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
+        deleted = await db.fetchone(
+            "DELETE FROM wifi_users WHERE id = %s RETURNING id", (user_id,), prepared="delete_wifi_user"
+        )
         
         if deleted:
+            read_cache.invalidate()
+            event_hub.users_deleted([user_id])
             return JSONResponse({"success": True, "message": "User deleted successfully"})
         else:
             return JSONResponse({"success": False, "message": "User not found"}, status_code=404)
+    except PoolTimeout:
+        raise
     except Exception as e:
-        conn.rollback()
-        cur.close()
-        conn.close()
         return JSONResponse({"success": False, "message": str(e)}, status_code=500)
 
+# ==== Bulk Delete ====
+# Explicit id lists are deleted inline; date-range / role deletes run as
+# background jobs that remove BULK_DELETE_CHUNK rows per short transaction, so
+# row locks, trigger work on the rollup and WAL stay bounded per commit.
+BULK_DELETE_MAX_IDS = int(os.getenv("BULK_DELETE_MAX_IDS", "1000"))
+BULK_DELETE_CHUNK = int(os.getenv("BULK_DELETE_CHUNK", "500"))
+BULK_DELETE_PAUSE = float(os.getenv("BULK_DELETE_PAUSE", "0.05"))
+BULK_DELETE_MAX_JOBS = int(os.getenv("BULK_DELETE_MAX_JOBS", "2"))
+BULK_DELETE_JOB_TTL = float(os.getenv("BULK_DELETE_JOB_TTL", "3600"))
+
+
+def _delete_user_ids(conn, ids: List[int]) -> List[tuple]:
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM wifi_users WHERE id = ANY(%s) RETURNING id, created_at::date", (ids,))
+        return cur.fetchall()
+
+
+def _delete_user_chunk(conn, where_sql: str, params: List, limit: int) -> List[tuple]:
+    """Delete up to `limit` matching rows, oldest first; returns (id, day) pairs."""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            DELETE FROM wifi_users w
+            USING (SELECT id FROM wifi_users {where_sql} ORDER BY created_at, id LIMIT %s) d
+            WHERE w.id = d.id
+            RETURNING w.id, w.created_at::date
+        """, (*params, limit))
+        return cur.fetchall()
+
+
+def _bulk_delete_filter(data: dict) -> Tuple[str, List, dict]:
+    """Build the WHERE clause of a range delete from role / start_date / end_date."""
+    conditions: List[str] = []
+    params: List = []
+    filters = {}
+    if data.get("role"):
+        conditions.append("role = %s")
+        params.append(data["role"])
+        filters["role"] = data["role"]
+    if data.get("start_date"):
+        conditions.append("created_at >= %s")
+        params.append(datetime.strptime(data["start_date"], "%Y-%m-%d"))
+        filters["start_date"] = data["start_date"]
+    if data.get("end_date"):
+        conditions.append("created_at < %s")
+        params.append(datetime.strptime(data["end_date"], "%Y-%m-%d") + timedelta(days=1))
+        filters["end_date"] = data["end_date"]
+    if not conditions:
+        raise ValueError("Give ids, or at least one of role, start_date and end_date")
+    return f"WHERE {' AND '.join(conditions)}", params, filters
+
+
+def _after_delete(rows: List[tuple]):
+    read_cache.invalidate()
+    event_hub.users_deleted([user_id for user_id, _ in rows])
+
+
+async def _resketch_days(days: set):
+    """Recompute the unique-visitor sketches of days that lost rows."""
+    if not days:
+        return
+    try:
+        await db.run(rebuild_sketches, sorted(days))
+    except Exception as e:
+        logger.warning("Re-sketching %d day(s) after bulk delete failed: %s", len(days), e)
+
+
+class BulkDeletes:
+    """Range deletes running as background tasks with progress reporting."""
+
+    def __init__(self, chunk_size: int, pause: float, max_jobs: int, ttl: float):
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs: OrderedDict = OrderedDict()
+        self.deleted = 0
+
+    def _cleanup(self):
+        cutoff = time.time() - self.ttl
+        for job_id, job in list(self._jobs.items()):
+            if job["finished"] and job["finished"] < cutoff:
+                del self._jobs[job_id]
+
+    def running(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job["task"].done())
+
+    def submit(self, where_sql: str, params: List, filters: dict) -> Optional[dict]:
+        """Start a range delete; returns None when too many are running."""
+        self._cleanup()
+        if self.running() >= self.max_jobs:
+            return None
+        job = {
+            "id": uuid.uuid4().hex,
+            "filters": filters,
+            "status": "queued",
+            "total": None,
+            "deleted": 0,
+            "chunks": 0,
+            "created": time.time(),
+            "finished": None,
+            "error": None,
+            "cancel": False,
+        }
+        job["task"] = asyncio.create_task(self._run(job, where_sql, params))
+        self._jobs[job["id"]] = job
+        return job
+
+    async def _run(self, job: dict, where_sql: str, params: List):
+        days = set()
+        try:
+            job["status"] = "running"
+            (job["total"],) = await db.fetchone(f"SELECT COUNT(*) FROM wifi_users {where_sql}", params)
+            while not job["cancel"]:
+                rows = await db.run(_delete_user_chunk, where_sql, params, self.chunk_size)
+                if not rows:
+                    break
+                job["deleted"] += len(rows)
+                job["chunks"] += 1
+                self.deleted += len(rows)
+                days.update(day for _, day in rows if day)
+                _after_delete(rows)
+                # Let replicas, autovacuum and other writers keep up
+                await asyncio.sleep(self.pause)
+            job["status"] = "cancelled" if job["cancel"] else "done"
+        except asyncio.CancelledError:
+            job["status"] = "cancelled"
+            raise
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            logger.warning("Bulk delete %s failed after %d rows: %s", job["id"], job["deleted"], e)
+        finally:
+            job["finished"] = time.time()
+        await _resketch_days(days)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        self._cleanup()
+        return self._jobs.get(job_id)
+
+    def cancel(self, job: dict):
+        """Stop after the chunk in flight; rows already deleted stay deleted."""
+        job["cancel"] = True
+
+    def shutdown(self):
+        for job in self._jobs.values():
+            job["task"].cancel()
+
+    @staticmethod
+    def status(job: dict) -> dict:
+        total = job["total"]
+        return {
+            "id": job["id"],
+            "status": job["status"],
+            "filters": job["filters"],
+            "total": total,
+            "deleted": job["deleted"],
+            "chunks": job["chunks"],
+            "progress": round(min(job["deleted"] / total, 1.0), 3) if total else (1.0 if job["finished"] else 0.0),
+            "error": job["error"],
+        }
+
+    def stats(self) -> dict:
+        return {"running": self.running(), "jobs": len(self._jobs), "deleted": self.deleted}
+
+
+bulk_deletes = BulkDeletes(BULK_DELETE_CHUNK, BULK_DELETE_PAUSE, BULK_DELETE_MAX_JOBS, BULK_DELETE_JOB_TTL)
+
+
+@app.post("/api/users/bulk-delete")
+async def bulk_delete_users(request: Request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return JSONResponse({"success": False, "message": "Invalid JSON body"}, status_code=400)
+
+    if "ids" in data:
+        raw_ids = data["ids"]
+        # bool is an int subclass; a string or dict would iterate into bogus ids
+        if not isinstance(raw_ids, list) or not all(
+            isinstance(user_id, int) and not isinstance(user_id, bool) for user_id in raw_ids
+        ):
+            return JSONResponse({"success": False, "message": "ids must be a list of integers"}, status_code=400)
+        ids = sorted(set(raw_ids))
+        if not ids:
+            return JSONResponse({"success": False, "message": "No ids given"}, status_code=400)
+        if len(ids) > BULK_DELETE_MAX_IDS:
+            return JSONResponse(
+                {"success": False, "message": f"At most {BULK_DELETE_MAX_IDS} ids per request"}, status_code=400
+            )
+        deleted: List[tuple] = []
+        for i in range(0, len(ids), BULK_DELETE_CHUNK):
+            rows = await db.run(_delete_user_ids, ids[i:i + BULK_DELETE_CHUNK])
+            if rows:
+                deleted.extend(rows)
+                _after_delete(rows)
+        await _resketch_days({day for _, day in deleted if day})
+        return JSONResponse({
+            "success": True,
+            "message": f"{len(deleted)} user(s) deleted",
+            "deleted": len(deleted),
+            "ids": [user_id for user_id, _ in deleted],
+        })
+
+    try:
+        where_sql, params, filters = _bulk_delete_filter(data)
+    except ValueError as e:
+        return JSONResponse({"success": False, "message": str(e)}, status_code=400)
+    job = bulk_deletes.submit(where_sql, params, filters)
+    if job is None:
+        return JSONResponse(
+            {"success": False, "message": "Too many bulk deletes in progress, please retry shortly"},
+            status_code=503,
+            headers={"Retry-After": "5"},
+        )
+    return JSONResponse({"success": True, "job": bulk_deletes.status(job)}, status_code=202)
+
+@app.get("/api/users/bulk-delete/{job_id}")
+async def bulk_delete_status(job_id: str):
+    job = bulk_deletes.get(job_id)
+    if job is None:
+        return JSONResponse({"success": False, "message": "Job not found"}, status_code=404)
+    return JSONResponse({"success": True, "job": bulk_deletes.status(job)})
+
+@app.delete("/api/users/bulk-delete/{job_id}")
+async def cancel_bulk_delete(job_id: str):
+    job = bulk_deletes.get(job_id)
+    if job is None:
+        return JSONResponse({"success": False, "message": "Job not found"}, status_code=404)
+    bulk_deletes.cancel(job)
+    return JSONResponse({"success": True, "job": bulk_deletes.status(job)})
+
+# ==== Verified Email Cache ====
+# Returning guests re-verify on every connection. Emails known to be verified
+# in trial_emails are kept in a bounded LRU set so the callback can redirect
+# without the upsert. An email is only added after its row is committed (or
+# read back at startup), so a miss just means "do the upsert": a first-time
+# verification can never be skipped.
+VERIFIED_EMAIL_CACHE_SIZE = int(os.getenv("VERIFIED_EMAIL_CACHE_SIZE", "100000"))
+
+
+class VerifiedEmails:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._emails: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, email: str) -> bool:
+        if email in self._emails:
+            self._emails.move_to_end(email)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, email: str):
+        self._emails[email] = None
+        self._emails.move_to_end(email)
+        while len(self._emails) > self.max_entries:
+            self._emails.popitem(last=False)
+
+    async def warm(self):
+        """Load the most recently verified emails from trial_emails."""
+        rows = await db.fetchall(
+            "SELECT email FROM trial_emails WHERE is_verified ORDER BY created_at DESC NULLS LAST LIMIT %s",
+            (self.max_entries,),
+        )
+        # Oldest first, so the most recent end up as most recently used.
+        for (email,) in reversed(rows):
+            self.add(email)
+
+    def stats(self) -> dict:
+        return {"size": len(self._emails), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+verified_emails = VerifiedEmails(VERIFIED_EMAIL_CACHE_SIZE)
+
 # ==== Google Login ====
 @app.get("/auth/google/login")
 async def login_google(request: StarletteRequest):
@@ -267,17 +3148,14 @@ async def auth_google_callback(request: StarletteRequest):
 
     email = user_info["email"]
 
-    # Save or update in DB as verified
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO trial_emails (email, is_verified)
-        VALUES (%s, TRUE)
-        ON CONFLICT (email) DO UPDATE SET is_verified = TRUE
-    """, (email,))
-    conn.commit()
-    cur.close()
-    conn.close()
+    # Save or update in DB as verified (skipped when already known verified)
+    if email not in verified_emails:
+        await db.execute("""
+            INSERT INTO trial_emails (email, is_verified)
+            VALUES (%s, TRUE)
+            ON CONFLICT (email) DO UPDATE SET is_verified = TRUE
+        """, (email,), prepared="upsert_trial_email")
+        verified_emails.add(email)
 
     login_url = (
         f"http://{GATEWAY_IP}/login?"
@@ -296,45 +3174,23 @@ async def dashboard_login(request: Request):
                 page = 1
         except (ValueError, TypeError):
             page = 1
-        # Pass-through filter params
+        try:
+            page_size = min(max(int(request.query_params.get("page_size", 20)), 1), DASHBOARD_MAX_PAGE_SIZE)
+        except (ValueError, TypeError):
+            page_size = 20
+        # Pass-through filter and keyset cursor params
         return await show_dashboard(
             page=page,
+            page_size=page_size,
             date_filter=request.query_params.get("date_filter"),
             start_date_str=request.query_params.get("start_date"),
             end_date_str=request.query_params.get("end_date"),
+            after=request.query_params.get("after"),
+            before=request.query_params.get("before"),
+            last=request.query_params.get("last") == "1",
         )
 
-    html = """
-    <html>
-      <head>
-        <title>Dashboard Login</title>
-        <style>
-          body {
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            background: linear-gradient(135deg, #667eea, #764ba2);
-            display: flex; justify-content: center; align-items: center; height: 100vh; margin: 0;
-          }
-          .login-box {
-            background: white; padding: 40px; border-radius: 12px;
-            box-shadow: 0 10px 25px rgba(0,0,0,0.2); text-align: center; width: 300px;
-          }
-          input[type=password] { width: 100%; padding: 12px 10px; margin: 15px 0; border-radius: 6px; border: 1px solid #ccc; font-size: 16px; }
-          button { background: #667eea; color: white; border: none; padding: 12px 20px; border-radius: 6px; cursor: pointer; font-size: 16px; }
-          button:hover { background: #5a67d8; }
-        </style>
-      </head>
-      <body>
-        <div class="login-box">
-          <h2>🔒 Dashboard Login</h2>
-          <form method="post" action="/dashboard">
-            <input type="password" name="password" placeholder="Enter password" required>
-            <button type="submit">Login</button>
-          </form>
-        </div>
-      </body>
-    </html>
-    """
-    return HTMLResponse(content=html)
+    return HTMLResponse(content=_DASHBOARD_LOGIN_PAGE)
 
 # ==== Handle Dashboard Login ====
 # ==== Handle Dashboard Login ====
@@ -413,84 +3269,199 @@ def _compute_date_range(
 
     return None, None, "All time"
 
-async def show_dashboard(page: int = 1, page_size: int = 20, date_filter: Optional[str] = None, start_date_str: Optional[str] = None, end_date_str: Optional[str] = None):
-    conn = get_connection()
+DASHBOARD_COUNT_TTL = float(os.getenv("DASHBOARD_COUNT_TTL", "60"))
+DASHBOARD_ESTIMATE_MIN = int(os.getenv("DASHBOARD_ESTIMATE_MIN", "50000"))
+_dashboard_counts: dict = {}
+
+
+def _dashboard_count(cur, where_sql: str, params: List) -> Tuple[int, bool]:
+    """Row count for the dashboard header, cached for DASHBOARD_COUNT_TTL seconds.
+
+    Unfiltered counts on a large table come from the planner's reltuples
+    estimate instead of a full scan. Returns (count, is_estimate).
+    """
+    key = (where_sql, tuple(params))
+    cached = _dashboard_counts.get(key)
+    if cached and cached[2] > time.monotonic():
+        return cached[0], cached[1]
+
+    estimated = False
+    total_count = None
+    if not where_sql:
+        cur.execute("SELECT reltuples::BIGINT FROM pg_class WHERE oid = 'trial_emails'::regclass")
+        estimate = cur.fetchone()[0]
+        if estimate >= DASHBOARD_ESTIMATE_MIN:
+            total_count, estimated = estimate, True
+    if total_count is None:
+        cur.execute(f"SELECT COUNT(*) FROM trial_emails {where_sql}", params)
+        total_count = cur.fetchone()[0]
+
+    if len(_dashboard_counts) > 256:
+        _dashboard_counts.clear()
+    _dashboard_counts[key] = (total_count, estimated, time.monotonic() + DASHBOARD_COUNT_TTL)
+    return total_count, estimated
+
+
+def _fetch_dashboard_page(
+    conn, where_sql: str, params: List, page_size: int,
+    after: Optional[Tuple[datetime, str]], before: Optional[Tuple[datetime, str]], last: bool,
+):
+    """Fetch one dashboard page with keyset pagination on (created_at, email).
+
+    `after` walks towards older rows, `before` towards newer ones and `last`
+    jumps to the oldest page. Returns (total, is_estimate, rows, has_newer, has_older).
+    """
     cur = conn.cursor()
-    
-    # Build WHERE clause from date filter
-    start_dt, end_dt, range_label = _compute_date_range(date_filter, start_date_str, end_date_str)
-    where_sql = ""
-    params: List = []
-    if start_dt and end_dt:
-        where_sql = "WHERE created_at BETWEEN %s AND %s"
-        params.extend([start_dt, end_dt])
 
-    # Get total count for pagination
-    cur.execute(f"SELECT COUNT(*) FROM trial_emails {where_sql}", params)
-    total_count = cur.fetchone()[0]
-    
-    # Calculate offset
-    offset = (page - 1) * page_size
-    
-    # Get paginated results
+    # Get total count for pagination
+    total_count, estimated = _dashboard_count(cur, where_sql, params)
+
+    conditions = [where_sql[len("WHERE "):]] if where_sql else []
+    query_params = list(params)
+    if before:
+        conditions.append("(created_at, email) > (%s, %s)")
+        query_params.extend(before)
+        order = "ASC"
+    elif after:
+        conditions.append("(created_at, email) < (%s, %s)")
+        query_params.extend(after)
+        order = "DESC"
+    else:
+        order = "ASC" if last else "DESC"
+    keyset_where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    # Get one row more than a page to know whether another page follows
     cur.execute(
         f"""
         SELECT email, created_at 
         FROM trial_emails 
-        {where_sql}
-        ORDER BY created_at DESC 
-        LIMIT %s OFFSET %s
+        {keyset_where}
+        ORDER BY created_at {order}, email {order}
+        LIMIT %s
     """,
-        (*params, page_size, offset),
+        (*query_params, page_size + 1),
     )
     rows = cur.fetchall()
     cur.close()
-    conn.close()
 
-    # Calculate pagination info
-    total_pages = (total_count + page_size - 1) // page_size
-    has_prev = page > 1
-    has_next = page < total_pages
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if order == "ASC":
+        rows.reverse()
+        has_newer, has_older = has_more, not last
+    else:
+        has_newer, has_older = bool(after), has_more
+    return total_count, estimated, rows, has_newer, has_older
 
-    # Build filter query string for pagination links
-    filter_qs = ""
-    if date_filter:
-        filter_qs += f"&date_filter={date_filter}"
-    if start_date_str:
-        filter_qs += f"&start_date={start_date_str}"
-    if end_date_str:
-        filter_qs += f"&end_date={end_date_str}"
+# XLSX/PDF downloads run as background jobs; the form polls until the file is ready
+_EXPORT_POLL_SCRIPT = """<script>
+          (function () {
+            var form = document.getElementById('export-form');
+            var status = document.getElementById('export-status');
+            function fail(err) { status.textContent = '❌ ' + err.message; }
+            function poll(id) {
+              fetch('/dashboard/export/jobs/' + id)
+                .then(function (r) { return r.json(); })
+                .then(function (data) {
+                  if (!data.success) throw new Error(data.error || 'Export failed');
+                  var job = data.job;
+                  if (job.status === 'done') {
+                    status.textContent = '';
+                    window.location = job.download_url;
+                  } else if (job.status === 'failed') {
+                    throw new Error(job.error || 'Export failed');
+                  } else {
+                    status.textContent = 'Export ' + job.status + '...';
+                    setTimeout(function () { poll(id); }, 1000);
+                  }
+                })
+                .catch(fail);
+            }
+            form.addEventListener('submit', function (e) {
+              var fmt = form.querySelector('input[name=format]:checked').value;
+              if (fmt === 'csv') return;
+              e.preventDefault();
+              status.textContent = 'Preparing ' + fmt.toUpperCase() + '...';
+              fetch('/dashboard/export/jobs', { method: 'POST', body: new FormData(form) })
+                .then(function (r) { return r.json(); })
+                .then(function (data) {
+                  if (!data.success) throw new Error(data.error || 'Export failed');
+                  poll(data.job.id);
+                })
+                .catch(fail);
+            });
+          })();
+        </script>"""
+
+# ==== Dashboard Templates ====
+# Dashboard pages are assembled from fragments compiled once at import: static
+# markup is pre-encoded, only the small dynamic parts are formatted per request
+# and table rows are streamed in chunks. Output is byte-for-byte what the old
+# string-concatenation renderer produced.
+DASHBOARD_ROW_CHUNK = 200
+DASHBOARD_MAX_PAGE_SIZE = int(os.getenv("DASHBOARD_MAX_PAGE_SIZE", "1000"))
+
+_DASHBOARD_LOGIN_PAGE = """
+    <html>
+      <head>
+        <title>Dashboard Login</title>
+        <style>
+          body {
+            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+            background: linear-gradient(135deg, #667eea, #764ba2);
+            display: flex; justify-content: center; align-items: center; height: 100vh; margin: 0;
+          }
+          .login-box {
+            background: white; padding: 40px; border-radius: 12px;
+            box-shadow: 0 10px 25px rgba(0,0,0,0.2); text-align: center; width: 300px;
+          }
+          input[type=password] { width: 100%; padding: 12px 10px; margin: 15px 0; border-radius: 6px; border: 1px solid #ccc; font-size: 16px; }
+          button { background: #667eea; color: white; border: none; padding: 12px 20px; border-radius: 6px; cursor: pointer; font-size: 16px; }
+          button:hover { background: #5a67d8; }
+        </style>
+      </head>
+      <body>
+        <div class="login-box">
+          <h2>🔒 Dashboard Login</h2>
+          <form method="post" action="/dashboard">
+            <input type="password" name="password" placeholder="Enter password" required>
+            <button type="submit">Login</button>
+          </form>
+        </div>
+      </body>
+    </html>
+    """.encode("utf-8")
 
-    html = f"""
+_DASHBOARD_HEAD = """
     <html>
       <head>
         <title>Email Dashboard</title>
         <style>
-          body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: #f3f4f6; padding: 20px; }}
-          h1 {{ text-align: center; color: #333; }}
-          .filters {{ background: white; border-radius: 8px; padding: 16px; box-shadow: 0 5px 15px rgba(0,0,0,0.08); }}
-          .filters form {{ display: flex; flex-wrap: wrap; gap: 12px; align-items: end; }}
-          .filters label {{ font-size: 13px; color: #555; }}
-          .filters select, .filters input[type=date] {{ padding: 8px 10px; border: 1px solid #ccc; border-radius: 6px; }}
-          .filters button {{ background: #4f46e5; color: white; border: none; padding: 10px 14px; border-radius: 6px; cursor: pointer; }}
-          .pagination-info {{ text-align: center; margin: 10px 0; color: #666; font-size: 14px; }}
-          table {{ width: 100%; border-collapse: collapse; margin-top: 20px; background: white; border-radius: 8px; overflow: hidden; box-shadow: 0 5px 15px rgba(0,0,0,0.1); }}
-          th, td {{ padding: 12px 15px; text-align: left; }}
-          th {{ background: #667eea; color: white; }}
-          tr:nth-child(even) {{ background: #f2f2f2; }}
-          .logout, .download {{ display: inline-block; margin: 10px; text-decoration: none; font-weight: bold; padding: 10px 15px; border-radius: 6px; }}
-          .logout {{ color: #667eea; border: 1px solid #667eea; }}
-          .logout:hover {{ background: #667eea; color: white; }}
-          .download {{ background: #10b981; color: white; }}
-          .download:hover {{ background: #059669; }}
-          .buttons {{ text-align:center; margin-top: 20px; }}
-          .pagination {{ text-align: center; margin: 20px 0; }}
-          .pagination a {{ display: inline-block; padding: 8px 12px; margin: 0 4px; text-decoration: none; border: 1px solid #667eea; border-radius: 4px; color: #667eea; }}
-          .pagination a:hover {{ background: #667eea; color: white; }}
-          .pagination .current {{ background: #667eea; color: white; }}
-          .pagination .disabled {{ color: #ccc; border-color: #ccc; cursor: not-allowed; }}
-          .pagination .disabled:hover {{ background: transparent; color: #ccc; }}
-          @media(max-width: 600px) {{ table, th, td {{ font-size: 14px; }} }}
+          body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: #f3f4f6; padding: 20px; }
+          h1 { text-align: center; color: #333; }
+          .filters { background: white; border-radius: 8px; padding: 16px; box-shadow: 0 5px 15px rgba(0,0,0,0.08); }
+          .filters form { display: flex; flex-wrap: wrap; gap: 12px; align-items: end; }
+          .filters label { font-size: 13px; color: #555; }
+          .filters select, .filters input[type=date] { padding: 8px 10px; border: 1px solid #ccc; border-radius: 6px; }
+          .filters button { background: #4f46e5; color: white; border: none; padding: 10px 14px; border-radius: 6px; cursor: pointer; }
+          .pagination-info { text-align: center; margin: 10px 0; color: #666; font-size: 14px; }
+          table { width: 100%; border-collapse: collapse; margin-top: 20px; background: white; border-radius: 8px; overflow: hidden; box-shadow: 0 5px 15px rgba(0,0,0,0.1); }
+          th, td { padding: 12px 15px; text-align: left; }
+          th { background: #667eea; color: white; }
+          tr:nth-child(even) { background: #f2f2f2; }
+          .logout, .download { display: inline-block; margin: 10px; text-decoration: none; font-weight: bold; padding: 10px 15px; border-radius: 6px; }
+          .logout { color: #667eea; border: 1px solid #667eea; }
+          .logout:hover { background: #667eea; color: white; }
+          .download { background: #10b981; color: white; }
+          .download:hover { background: #059669; }
+          .buttons { text-align:center; margin-top: 20px; }
+          .pagination { text-align: center; margin: 20px 0; }
+          .pagination a { display: inline-block; padding: 8px 12px; margin: 0 4px; text-decoration: none; border: 1px solid #667eea; border-radius: 4px; color: #667eea; }
+          .pagination a:hover { background: #667eea; color: white; }
+          .pagination .current { background: #667eea; color: white; }
+          .pagination .disabled { color: #ccc; border-color: #ccc; cursor: not-allowed; }
+          .pagination .disabled:hover { background: transparent; color: #ccc; }
+          @media(max-width: 600px) { table, th, td { font-size: 14px; } }
         </style>
       </head>
       <body>
@@ -500,23 +3471,40 @@ async def show_dashboard(page: int = 1, page_size: int = 20, date_filter: Option
             <div>
               <label for="date_filter">Date</label><br>
               <select name="date_filter" id="date_filter">
-                <option value="" {"selected" if not date_filter else ""}>All time</option>
-                <option value="today" {"selected" if date_filter=="today" else ""}>Today</option>
-                <option value="yesterday" {"selected" if date_filter=="yesterday" else ""}>Yesterday</option>
-                <option value="last7" {"selected" if date_filter=="last7" else ""}>Last 7 days</option>
-                <option value="last30" {"selected" if date_filter=="last30" else ""}>Last 30 days</option>
-                <option value="thisMonth" {"selected" if date_filter=="thisMonth" else ""}>This month</option>
-                <option value="prevMonth" {"selected" if date_filter=="prevMonth" else ""}>Previous month</option>
-                <option value="custom" {"selected" if date_filter=="custom" else ""}>Custom range</option>
-              </select>
+""".encode("utf-8")
+
+_DATE_FILTERS = [
+    ("", "All time"),
+    ("today", "Today"),
+    ("yesterday", "Yesterday"),
+    ("last7", "Last 7 days"),
+    ("last30", "Last 30 days"),
+    ("thisMonth", "This month"),
+    ("prevMonth", "Previous month"),
+    ("custom", "Custom range"),
+]
+
+
+def _compile_date_options(selected: Optional[str]) -> bytes:
+    return "".join(
+        f'                <option value="{value}" {"selected" if value == selected else ""}>{label}</option>\n'
+        for value, label in _DATE_FILTERS
+    ).encode("utf-8")
+
+
+# One pre-rendered <option> block per selectable value; None = nothing selected.
+_DATE_OPTIONS = {value: _compile_date_options(value) for value, _ in _DATE_FILTERS}
+_DATE_OPTIONS[None] = _compile_date_options(None)
+
+_DASHBOARD_FILTERS = """              </select>
             </div>
             <div>
               <label for="start_date">Start</label><br>
-              <input type="date" name="start_date" id="start_date" value="{start_date_str or ''}">
+              <input type="date" name="start_date" id="start_date" value="{start_date}">
             </div>
             <div>
               <label for="end_date">End</label><br>
-              <input type="date" name="end_date" id="end_date" value="{end_date_str or ''}">
+              <input type="date" name="end_date" id="end_date" value="{end_date}">
             </div>
             <div>
               <input type="hidden" name="page" value="1">
@@ -526,71 +3514,139 @@ async def show_dashboard(page: int = 1, page_size: int = 20, date_filter: Option
           <div style="margin-top:8px;color:#666;font-size:13px;">Range: {range_label}</div>
         </div>
         <div class="pagination-info">
-          Showing {len(rows)} of {total_count} emails (Page {page} of {total_pages})
+          Showing {shown} of {count_label} emails (Page {page} of {total_pages})
         </div>
         <table>
           <tr><th>Email</th><th>Created At</th></tr>
     """
-    for email, created_at in rows:
-        html += f"<tr><td>{email}</td><td>{created_at.date()}</td></tr>"
 
-    # Add pagination controls
-    html += """
+_DASHBOARD_ROW = "<tr><td>{}</td><td>{}</td></tr>"
+
+_DASHBOARD_TABLE_END = """
         </table>
         <div class="pagination">
-    """
-    
-    # Previous button
-    if has_prev:
-        html += f'<a href="/dashboard?page={page-1}{filter_qs}">« Previous</a>'
-    else:
-        html += '<span class="disabled">« Previous</span>'
-    
-    # Page numbers (show up to 5 pages around current page)
-    start_page = max(1, page - 2)
-    end_page = min(total_pages, page + 2)
-    
-    if start_page > 1:
-        html += f'<a href="/dashboard?page=1{filter_qs}">1</a>'
-        if start_page > 2:
-            html += '<span>...</span>'
-    
-    for p in range(start_page, end_page + 1):
-        if p == page:
-            html += f'<span class="current">{p}</span>'
-        else:
-            html += f'<a href="/dashboard?page={p}{filter_qs}">{p}</a>'
-    
-    if end_page < total_pages:
-        if end_page < total_pages - 1:
-            html += '<span>...</span>'
-        html += f'<a href="/dashboard?page={total_pages}{filter_qs}">{total_pages}</a>'
-    
-    # Next button
-    if has_next:
-        html += f'<a href="/dashboard?page={page+1}{filter_qs}">Next »</a>'
-    else:
-        html += '<span class="disabled">Next »</span>'
-    
-    html += """
+    """.encode("utf-8")
+
+_DASHBOARD_EXPORT_FORM = """
         </div>
         <div class="buttons">
-            <form method="get" action="/dashboard/export" style="display:inline-block;margin:10px;">
-                <input type="hidden" name="date_filter" value="{date_filter or ''}">
-                <input type="hidden" name="start_date" value="{start_date_str or ''}">
-                <input type="hidden" name="end_date" value="{end_date_str or ''}">
+            <form method="get" action="/dashboard/export" id="export-form" style="display:inline-block;margin:10px;">
+                <input type="hidden" name="date_filter" value="{date_filter}">
+                <input type="hidden" name="start_date" value="{start_date}">
+                <input type="hidden" name="end_date" value="{end_date}">
                 <label style="margin-right:6px;">Format:</label>
                 <label><input type="radio" name="format" value="csv" checked> CSV</label>
                 <label><input type="radio" name="format" value="xlsx"> XLSX</label>
                 <label><input type="radio" name="format" value="pdf"> PDF</label>
                 <button class="download" type="submit">Download</button>
+                <span id="export-status" style="margin-left:6px;color:#666;font-size:13px;"></span>
             </form>
             <a href="/dashboard/logout" class="logout">Logout</a>
         </div>
+        """
+
+_DASHBOARD_FOOT = (_EXPORT_POLL_SCRIPT + """
       </body>
     </html>
-    """
-    return HTMLResponse(content=html)
+    """).encode("utf-8")
+
+
+def _dashboard_pagination(page: int, total_pages: int, rows: List[tuple], filter_qs: str,
+                          has_prev: bool, has_next: bool) -> str:
+    # Keyset navigation: Previous/Next carry the boundary row of this page
+    parts = []
+    if has_prev and rows:
+        first_cursor = quote(_encode_cursor(rows[0][1], rows[0][0]))
+        parts.append(f'<a href="/dashboard?page=1{filter_qs}">« First</a>')
+        parts.append(f'<a href="/dashboard?page={page-1}&before={first_cursor}{filter_qs}">« Previous</a>')
+    else:
+        parts.append('<span class="disabled">« First</span>')
+        parts.append('<span class="disabled">« Previous</span>')
+
+    parts.append(f'<span class="current">{page}</span>')
+
+    if has_next and rows:
+        last_cursor = quote(_encode_cursor(rows[-1][1], rows[-1][0]))
+        parts.append(f'<a href="/dashboard?page={page+1}&after={last_cursor}{filter_qs}">Next »</a>')
+        parts.append(f'<a href="/dashboard?page={total_pages}&last=1{filter_qs}">Last »</a>')
+    else:
+        parts.append('<span class="disabled">Next »</span>')
+        parts.append('<span class="disabled">Last »</span>')
+    return "".join(parts)
+
+async def show_dashboard(
+    page: int = 1, page_size: int = 20, date_filter: Optional[str] = None,
+    start_date_str: Optional[str] = None, end_date_str: Optional[str] = None,
+    after: Optional[str] = None, before: Optional[str] = None, last: bool = False,
+):
+    # Build WHERE clause from date filter
+    start_dt, end_dt, range_label = _compute_date_range(date_filter, start_date_str, end_date_str)
+    where_sql = ""
+    params: List = []
+    if start_dt and end_dt:
+        where_sql = "WHERE created_at BETWEEN %s AND %s"
+        params.extend([start_dt, end_dt])
+
+    try:
+        after_key = _decode_cursor(after) if after else None
+        before_key = _decode_cursor(before) if before else None
+    except ValueError:
+        after_key = before_key = None
+    if not (after_key or before_key or last):
+        page = 1
+
+    total_count, estimated, rows, has_newer, has_older = await reads.run(
+        REPLICA_STALENESS["dashboard"], _fetch_dashboard_page, where_sql, params, page_size, after_key, before_key, last
+    )
+
+    # Calculate pagination info; page numbers are positional hints only
+    total_pages = max(1, (total_count + page_size - 1) // page_size)
+    if not has_newer:
+        page = 1
+    elif not has_older:
+        page = total_pages
+    else:
+        page = min(max(page, 1), total_pages)
+    has_prev = has_newer
+    has_next = has_older
+    count_label = f"~{total_count}" if estimated else str(total_count)
+
+    # Build filter query string for pagination links
+    filter_qs = ""
+    if date_filter:
+        filter_qs += f"&date_filter={quote(date_filter)}"
+    if start_date_str:
+        filter_qs += f"&start_date={quote(start_date_str)}"
+    if end_date_str:
+        filter_qs += f"&end_date={quote(end_date_str)}"
+    if page_size != 20:
+        filter_qs += f"&page_size={page_size}"
+
+    async def render():
+        yield _DASHBOARD_HEAD
+        yield _DATE_OPTIONS.get(date_filter or "", _DATE_OPTIONS[None])
+        with trace_phase("render"):
+            filters = _DASHBOARD_FILTERS.format(
+                start_date=start_date_str or "", end_date=end_date_str or "", range_label=range_label,
+                shown=len(rows), count_label=count_label, page=page, total_pages=total_pages,
+            ).encode("utf-8")
+        yield filters
+        for start in range(0, len(rows), DASHBOARD_ROW_CHUNK):
+            with trace_phase("render"):
+                chunk = rows[start:start + DASHBOARD_ROW_CHUNK]
+                html = "".join(_DASHBOARD_ROW.format(email, created_at.date()) for email, created_at in chunk)
+            yield html.encode("utf-8")
+        yield _DASHBOARD_TABLE_END
+        with trace_phase("render"):
+            pagination = _dashboard_pagination(page, total_pages, rows, filter_qs, has_prev, has_next)
+            export_form = _DASHBOARD_EXPORT_FORM.format(
+                date_filter=date_filter or "", start_date=start_date_str or "", end_date=end_date_str or "",
+            )
+        yield pagination.encode("utf-8")
+        yield export_form.encode("utf-8")
+        yield _DASHBOARD_FOOT
+
+    return StreamingResponse(render(), media_type="text/html")
 
 # ==== Dashboard Logout ====
 @app.get("/dashboard/logout")
@@ -599,106 +3655,642 @@ async def dashboard_logout(request: Request):
     return RedirectResponse("/dashboard")
 
 # ==== Export by Date and Format ====
-@app.get("/dashboard/export")
-async def export_data(request: Request):
-    if not request.session.get("logged_in"):
-        return RedirectResponse("/dashboard")
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "2000"))
+EXPORT_GZIP = os.getenv("EXPORT_GZIP", "1") == "1"
 
-    qp = request.query_params
-    fmt = (qp.get("format") or "csv").lower()
-    date_filter = qp.get("date_filter")
-    start_date_str = qp.get("start_date")
-    end_date_str = qp.get("end_date")
 
-    start_dt, end_dt, _ = _compute_date_range(date_filter, start_date_str, end_date_str)
+def _email_csv_row(row) -> list:
+    email, created_at = row
+    return [email, created_at.date()]
+
+
+async def _stream_csv(sql: str, params: List, compress: bool, source: DBPool = db,
+                      header=("Email", "Created At"), csv_row=_email_csv_row):
+    """Encode export rows as CSV chunks while they arrive from the database."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buf = StringIO()
+    writer = csv.writer(buf)
+
+    def take() -> bytes:
+        data = buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate(0)
+        if compressor is None:
+            return data
+        # Sync-flush per batch so compressed bytes reach the client as rows arrive
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    start = time.perf_counter()
+    size = 0
+    writer.writerow(header)
+    chunk = take()
+    size += len(chunk)
+    yield chunk
+    async for rows in reads.stream(source, sql, params, EXPORT_FETCH_SIZE):
+        for row in rows:
+            writer.writerow(csv_row(row))
+        chunk = take()
+        if chunk:
+            size += len(chunk)
+            yield chunk
+    if compressor:
+        chunk = compressor.flush()
+        size += len(chunk)
+        yield chunk
+    EXPORT_LATENCY.observe(time.perf_counter() - start, "csv")
+    EXPORT_BYTES.observe(size, "csv")
+
+
+def _iter_cursor_batches(conn, sql: str, params: List, fetch_size: int):
+    """Synchronous counterpart of DBPool.stream for code already running in a thread."""
+    with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cur:
+        cur.itersize = fetch_size
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield rows
+
+
+def _write_csv(fileobj, batches):
+    """Write export rows to a binary `fileobj` as CSV (same layout as _stream_csv)."""
+    buf = StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["Email", "Created At"])
+    for rows in batches:
+        for email, created_at in rows:
+            writer.writerow([email, created_at.date()])
+        fileobj.write(buf.getvalue().encode("utf-8"))
+        buf.seek(0)
+        buf.truncate(0)
+    fileobj.write(buf.getvalue().encode("utf-8"))
+
+
+def _write_xlsx(fileobj, batches):
+    """Write export rows to `fileobj` using openpyxl's write-only mode.
+
+    Rows are serialized as they are appended, so memory use does not depend on
+    how many batches are fed in.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Emails")
+    ws.append(["Email", "Created At"])
+    for rows in batches:
+        for email, created_at in rows:
+            ws.append([email, created_at.date().isoformat()])
+    wb.save(fileobj)
+
+
+PDF_ROWS_PER_TABLE = int(os.getenv("PDF_ROWS_PER_TABLE", "30"))
+
+
+def _pdf_table(data: List[list]):
+    table = Table(data, colWidths=[350, 150], repeatRows=1)
+    table.setStyle(
+        TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#667eea")),
+            ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+            ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+            ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.whitesmoke, colors.HexColor("#f2f2f2")]),
+        ])
+    )
+    return table
+
+
+def _write_pdf(fileobj, batches):
+    """Write export rows to `fileobj` as a PDF.
+
+    Rows are laid out as a series of page-sized tables (PDF_ROWS_PER_TABLE rows
+    each, header repeated) instead of one giant Table flowable, whose split
+    cost grows with the square of the row count.
+    """
+    doc = SimpleDocTemplate(fileobj, pagesize=letter)
+    styles = getSampleStyleSheet()
+    elements = []
+    title = Paragraph("Collected Emails", styles["Title"])
+    elements.append(title)
+    elements.append(Spacer(1, 12))
+    header = ["Email", "Created At"]
+    chunk = [header]
+    for rows in batches:
+        for email, created_at in rows:
+            chunk.append([email, created_at.date().isoformat()])
+            if len(chunk) > PDF_ROWS_PER_TABLE:
+                elements.append(_pdf_table(chunk))
+                chunk = [header]
+    if len(chunk) > 1 or len(elements) == 2:
+        elements.append(_pdf_table(chunk))
+    doc.build(elements)
+
+
+def _render_export(fmt: str, sql: str, params: List, path: str, db_config: Optional[dict] = None) -> int:
+    """Render one export file; runs inside an export worker process.
+
+    The worker opens its own connection (to `db_config`, the primary by
+    default) so the rows never pass through the web process. Returns the size
+    of the written file.
+    """
+    try:
+        conn = psycopg2.connect(**db_config) if db_config else get_connection()
+    except psycopg2.OperationalError:
+        if not db_config or db_config == DB_CONFIG:
+            raise
+        # Replica went away after the render was routed to it
+        conn = get_connection()
+    try:
+        batches = _iter_cursor_batches(conn, sql, params, EXPORT_FETCH_SIZE)
+        with open(path, "wb") as f:
+            if fmt == "xlsx":
+                _write_xlsx(f, batches)
+            elif fmt == "pdf":
+                _write_pdf(f, batches)
+            else:
+                _write_csv(f, batches)
+    except BaseException:
+        if os.path.exists(path):
+            os.unlink(path)
+        raise
+    finally:
+        conn.close()
+    return os.path.getsize(path)
+
+
+# ==== Background Export Jobs ====
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_MAX_JOBS = int(os.getenv("EXPORT_MAX_JOBS", "8"))
+EXPORT_JOB_TTL = float(os.getenv("EXPORT_JOB_TTL", "900"))
+EXPORT_DIR = Path(os.getenv("EXPORT_DIR", Path(tempfile.gettempdir()) / "nuanu_exports"))
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+}
+
+
+class ExportJobs:
+    """Bounded queue of PDF/XLSX renders executed in a process pool.
+
+    At most `max_jobs` jobs may be queued or running; finished files are kept
+    for `ttl` seconds so they can be downloaded.
+    """
+
+    def __init__(self, workers: int, max_jobs: int, ttl: float, directory: Path):
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.directory = directory
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: dict = {}
+
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # spawn, not fork: the web process has live DB and event-loop threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(
+        self, fmt: str, sql: str, params: List, filename: str, cache_key: Optional[str] = None,
+        db_config: Optional[dict] = None,
+    ) -> Optional[dict]:
+        """Queue a render; returns None when the queue is full.
+
+        With a `cache_key`, the finished file is moved into the export cache.
+        `db_config` picks the database the worker reads from (primary by default).
+        """
+        self._cleanup()
+        if self._executor is None:
+            raise RuntimeError("Export workers are not running")
+        if sum(1 for job in self._jobs.values() if not job["future"].done()) >= self.max_jobs:
+            return None
+        job_id = uuid.uuid4().hex
+        path = self.directory / f"{job_id}.{fmt}"
+        job = {
+            "id": job_id,
+            "format": fmt,
+            "filename": filename,
+            "path": path,
+            "created": time.time(),
+            "cached": False,
+            # Set once the file is in its final place; the render future alone
+            # completes before the move into the cache.
+            "ready": False,
+            "finished": Future(),
+            "error": None,
+            "future": self._executor.submit(_render_export, fmt, sql, params, str(path), db_config),
+        }
+        job["future"].add_done_callback(lambda future: self._finish(job, cache_key))
+        self._jobs[job_id] = job
+        return job
+
+    def _finish(self, job: dict, cache_key: Optional[str]):
+        """Done-callback: record metrics and move the file into the cache, then mark the job ready."""
+        future = job["future"]
+        try:
+            if not future.cancelled() and future.exception() is None:
+                self._record(job)
+                if cache_key:
+                    self._store(job, cache_key)
+        except Exception as e:
+            logger.warning("Finishing export job %s failed: %s", job["id"], e)
+            job["error"] = str(e)
+        finally:
+            job["ready"] = True
+            job["finished"].set_result(None)
+
+    def _record(self, job: dict):
+        # Includes time spent queued for a worker
+        EXPORT_LATENCY.observe(time.time() - job["created"], job["format"])
+        EXPORT_BYTES.observe(job["future"].result(), job["format"])
+
+    def _store(self, job: dict, cache_key: str):
+        job["path"] = export_cache.put(job["path"], cache_key, job["format"])
+        job["cached"] = True
+
+    def get(self, job_id: str) -> Optional[dict]:
+        self._cleanup()
+        return self._jobs.get(job_id)
+
+    def discard(self, job_id: str):
+        job = self._jobs.pop(job_id, None)
+        if job is not None and not job["cached"] and job["path"].exists():
+            job["path"].unlink()
+
+    async def wait(self, job: dict):
+        """Wait until the job is ready; raises if the render failed."""
+        await asyncio.wrap_future(job["finished"])
+        job["future"].result()
+        if job["error"]:
+            raise RuntimeError(job["error"])
+
+    def status(self, job: dict) -> dict:
+        future = job["future"]
+        info = {"id": job["id"], "format": job["format"], "filename": job["filename"]}
+        if not job["ready"]:
+            info["status"] = "running" if future.running() or future.done() else "queued"
+        elif future.cancelled() or future.exception() is not None or job["error"]:
+            info["status"] = "failed"
+            info["error"] = "cancelled" if future.cancelled() else str(future.exception() or job["error"])
+        else:
+            info["status"] = "done"
+            info["size"] = future.result()
+            info["download_url"] = f"/dashboard/export/jobs/{job['id']}/download"
+        return info
+
+    def _cleanup(self):
+        cutoff = time.time() - self.ttl
+        for job_id, job in list(self._jobs.items()):
+            if job["created"] < cutoff and job["ready"]:
+                self.discard(job_id)
+
+    def stats(self) -> dict:
+        pending = sum(1 for job in self._jobs.values() if not job["future"].done())
+        return {"workers": self.workers, "pending": pending, "max_jobs": self.max_jobs, "tracked": len(self._jobs)}
+
+
+export_jobs = ExportJobs(EXPORT_WORKERS, EXPORT_MAX_JOBS, EXPORT_JOB_TTL, EXPORT_DIR)
+
+
+# ==== Export Cache ====
+# Rendered exports are kept on disk keyed by (range, format, data watermark), so
+# repeated downloads of the same preset are file sends instead of rebuilds.
+EXPORT_CACHE_DIR = Path(os.getenv("EXPORT_CACHE_DIR", Path(tempfile.gettempdir()) / "nuanu_export_cache"))
+EXPORT_CACHE_MAX_BYTES = int(float(os.getenv("EXPORT_CACHE_MAX_MB", "512")) * 1024 * 1024)
+EXPORT_PRERENDER_INTERVAL = float(os.getenv("EXPORT_PRERENDER_INTERVAL", "3600"))
+EXPORT_PRERENDER_PRESETS = ("yesterday", "prevMonth")
+
+
+class ExportCache:
+    """Disk-backed export cache with a total-size limit and LRU eviction.
+
+    File mtimes double as the LRU clock: a hit touches the file and eviction
+    removes the least recently touched files first.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(fmt: str, start_dt: Optional[datetime], end_dt: Optional[datetime], watermark: str) -> str:
+        range_key = f"{start_dt.isoformat()}_{end_dt.isoformat()}" if start_dt and end_dt else "all"
+        return hashlib.sha256(f"{range_key}|{fmt}|{watermark}".encode()).hexdigest()[:32]
+
+    def _path(self, key: str, fmt: str) -> Path:
+        return self.directory / f"{key}.{fmt}"
+
+    def get(self, key: str, fmt: str) -> Optional[Path]:
+        path = self._path(key, fmt)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def put(self, src: Path, key: str, fmt: str) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        dst = self._path(key, fmt)
+        os.replace(src, dst)
+        self._evict(keep=dst)
+        return dst
+
+    def _evict(self, keep: Path):
+        with self._lock:
+            files = []
+            for path in self.directory.iterdir():
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                path.unlink(missing_ok=True)
+                total -= size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "max_bytes": self.max_bytes}
+
+
+export_cache = ExportCache(EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES)
+
+
+def _fetch_export_watermark(conn, start_dt: Optional[datetime], end_dt: Optional[datetime]) -> str:
+    """Newest created_at in the range; an index probe, not a scan."""
+    with conn.cursor() as cur:
+        if start_dt and end_dt:
+            cur.execute(
+                "SELECT MAX(created_at) FROM trial_emails WHERE created_at BETWEEN %s AND %s", (start_dt, end_dt)
+            )
+        else:
+            cur.execute("SELECT MAX(created_at) FROM trial_emails")
+        row = cur.fetchone()
+    return row[0].isoformat() if row and row[0] else "empty"
+
+
+async def _export_watermark(start_dt: Optional[datetime], end_dt: Optional[datetime]) -> Tuple[DBPool, str]:
+    """(source, watermark): the export's rows must be read from the pool that gave the watermark."""
+    return await reads.run_with_source(REPLICA_STALENESS["export"], _fetch_export_watermark, start_dt, end_dt)
+
+
+async def _prerender_closed_periods():
+    """Render closed presets (yesterday, previous month) into the export cache."""
+    for preset in EXPORT_PRERENDER_PRESETS:
+        for fmt in EXPORT_MEDIA_TYPES:
+            if _export_unavailable(fmt):
+                continue
+            fmt, export_sql, params, fname, start_dt, end_dt = _export_request({"format": fmt, "date_filter": preset})
+            source, watermark = await _export_watermark(start_dt, end_dt)
+            cache_key = export_cache.key(fmt, start_dt, end_dt, watermark)
+            if export_cache.get(cache_key, fmt):
+                continue
+            job = export_jobs.submit(fmt, export_sql, params, fname, cache_key=cache_key, db_config=source.config)
+            if job is None:
+                return
+            try:
+                await export_jobs.wait(job)
+            except Exception as e:
+                logger.warning("Pre-render of %s %s failed: %s", preset, fmt, e)
+            export_jobs.discard(job["id"])
+
+
+async def _prerender_loop():
+    while True:
+        try:
+            await _prerender_closed_periods()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Export pre-render pass failed: %s", e)
+        await asyncio.sleep(EXPORT_PRERENDER_INTERVAL)
+
+
+_prerender_task: Optional[asyncio.Task] = None
+
+
+def _export_request(qp) -> Tuple[str, str, List, str, Optional[datetime], Optional[datetime]]:
+    """Resolve export query params to (format, sql, params, filename, start, end)."""
+    fmt = (qp.get("format") or "csv").lower()
+    start_dt, end_dt, _ = _compute_date_range(qp.get("date_filter"), qp.get("start_date"), qp.get("end_date"))
 
-    conn = get_connection()
-    cur = conn.cursor()
     params: List = []
     where_sql = ""
     if start_dt and end_dt:
         where_sql = "WHERE created_at BETWEEN %s AND %s"
         params.extend([start_dt, end_dt])
-    cur.execute(
-        f"SELECT email, created_at FROM trial_emails {where_sql} ORDER BY created_at DESC",
-        params,
+    export_sql = f"SELECT email, created_at FROM trial_emails {where_sql} ORDER BY created_at DESC"
+
+    fname = f"emails.{fmt}"
+    if start_dt and end_dt:
+        fname = f"emails_{start_dt.date().isoformat()}_{end_dt.date().isoformat()}.{fmt}"
+    return fmt, export_sql, params, fname, start_dt, end_dt
+
+
+def _export_unavailable(fmt: str) -> Optional[JSONResponse]:
+    if fmt not in EXPORT_MEDIA_TYPES:
+        return JSONResponse({"error": "Unsupported format"}, status_code=400)
+    if fmt == "xlsx" and Workbook is None:
+        return JSONResponse({"error": "XLSX export requires openpyxl to be installed"}, status_code=500)
+    if fmt == "pdf" and SimpleDocTemplate is None:
+        return JSONResponse({"error": "PDF export requires reportlab to be installed"}, status_code=500)
+    return None
+
+
+def _export_queue_full() -> JSONResponse:
+    return JSONResponse(
+        {"error": "Too many exports in progress, please retry shortly"},
+        status_code=503,
+        headers={"Retry-After": "5"},
     )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+
+
+@app.get("/dashboard/export")
+async def export_data(request: Request):
+    if not request.session.get("logged_in"):
+        return RedirectResponse("/dashboard")
+
+    fmt, export_sql, params, fname, start_dt, end_dt = _export_request(request.query_params)
+    unavailable = _export_unavailable(fmt)
+    if unavailable:
+        return unavailable
+
+    source, watermark = await _export_watermark(start_dt, end_dt)
+    cache_key = export_cache.key(fmt, start_dt, end_dt, watermark)
+    cached = export_cache.get(cache_key, fmt)
+    if cached:
+        return FileResponse(
+            cached,
+            media_type=EXPORT_MEDIA_TYPES[fmt],
+            headers={"Content-Disposition": f"attachment; filename={fname}"},
+        )
 
     # CSV
     if fmt == "csv":
-        csv_file = StringIO()
-        writer = csv.writer(csv_file)
-        writer.writerow(["Email", "Created At"])
-        for email, created_at in rows:
-            writer.writerow([email, created_at.date()])
-        csv_file.seek(0)
-        fname = "emails.csv"
-        if start_dt and end_dt:
-            fname = f"emails_{start_dt.date().isoformat()}_{end_dt.date().isoformat()}.csv"
+        headers = {"Content-Disposition": f"attachment; filename={fname}", "Vary": "Accept-Encoding"}
+        compress = EXPORT_GZIP and "gzip" in request.headers.get("accept-encoding", "")
+        if compress:
+            headers["Content-Encoding"] = "gzip"
         return StreamingResponse(
-            csv_file,
+            _stream_csv(export_sql, params, compress, source),
             media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={fname}"},
+            headers=headers,
         )
 
-    # XLSX
-    if fmt == "xlsx":
-        if Workbook is None:
-            return JSONResponse({"error": "XLSX export requires openpyxl to be installed"}, status_code=500)
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Emails"
-        ws.append(["Email", "Created At"])
-        for email, created_at in rows:
-            ws.append([email, created_at.date().isoformat()])
-        bio = BytesIO()
-        wb.save(bio)
-        bio.seek(0)
-        fname = "emails.xlsx"
-        if start_dt and end_dt:
-            fname = f"emails_{start_dt.date().isoformat()}_{end_dt.date().isoformat()}.xlsx"
-        return StreamingResponse(
-            bio,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename={fname}"},
-        )
+    # XLSX / PDF: render in a worker process and wait for it without blocking the loop
+    job = export_jobs.submit(fmt, export_sql, params, fname, cache_key=cache_key, db_config=source.config)
+    if job is None:
+        return _export_queue_full()
+    try:
+        await export_jobs.wait(job)
+    except Exception as e:
+        export_jobs.discard(job["id"])
+        return JSONResponse({"error": f"Export failed: {e}"}, status_code=500)
+    return FileResponse(
+        job["path"],
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename={fname}"},
+        background=BackgroundTask(export_jobs.discard, job["id"]),
+    )
 
-    # PDF
-    if fmt == "pdf":
-        if SimpleDocTemplate is None:
-            return JSONResponse({"error": "PDF export requires reportlab to be installed"}, status_code=500)
-        bio = BytesIO()
-        doc = SimpleDocTemplate(bio, pagesize=letter)
-        styles = getSampleStyleSheet()
-        elements = []
-        title = Paragraph("Collected Emails", styles["Title"])
-        elements.append(title)
-        elements.append(Spacer(1, 12))
-        data = [["Email", "Created At"]] + [[e, c.date().isoformat()] for e, c in rows]
-        table = Table(data, colWidths=[350, 150])
-        table.setStyle(
-            TableStyle([
-                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#667eea")),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
-                ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.whitesmoke, colors.HexColor("#f2f2f2")]),
-            ])
-        )
-        elements.append(table)
-        doc.build(elements)
-        bio.seek(0)
-        fname = "emails.pdf"
-        if start_dt and end_dt:
-            fname = f"emails_{start_dt.date().isoformat()}_{end_dt.date().isoformat()}.pdf"
-        return StreamingResponse(
-            bio,
-            media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename={fname}"},
-        )
+def _user_csv_row(row) -> list:
+    user_id, email, questions, role, ip_address, created_at = row
+    return [user_id, email, questions or "", role or "", ip_address or "", created_at.isoformat() if created_at else ""]
+
+
+@app.get("/api/users/export")
+async def export_users(request: Request):
+    """CSV of every wifi_users row matching the /api/users filters, for the admin page."""
+    try:
+        conditions, params = _users_filters(request.query_params)
+    except ValueError as e:
+        return JSONResponse({"success": False, "message": str(e)}, status_code=400)
+    where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    export_sql = f"""
+        SELECT id, email, questions, role, ip_address, created_at
+        FROM wifi_users {where_sql}
+        ORDER BY created_at DESC, id DESC
+    """
+    fname = f"nuanu-wifi-users-{date.today().isoformat()}.csv"
+    headers = {"Content-Disposition": f"attachment; filename={fname}", "Vary": "Accept-Encoding"}
+    compress = EXPORT_GZIP and "gzip" in request.headers.get("accept-encoding", "")
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    source = await reads.choose(REPLICA_STALENESS["export"])
+    return StreamingResponse(
+        _stream_csv(export_sql, params, compress, source,
+                    header=("ID", "Email", "Questions", "Role", "IP Address", "Date"), csv_row=_user_csv_row),
+        media_type="text/csv",
+        headers=headers,
+    )
+
+@app.post("/dashboard/export/jobs")
+async def create_export_job(request: Request):
+    if not request.session.get("logged_in"):
+        return JSONResponse({"error": "Not logged in"}, status_code=401)
+
+    form = await request.form()
+    fmt, export_sql, params, fname, start_dt, end_dt = _export_request(form)
+    unavailable = _export_unavailable(fmt)
+    if unavailable:
+        return unavailable
+    if fmt == "csv":
+        return JSONResponse({"error": "CSV exports stream directly from /dashboard/export"}, status_code=400)
+
+    source, watermark = await _export_watermark(start_dt, end_dt)
+    cache_key = export_cache.key(fmt, start_dt, end_dt, watermark)
+    if export_cache.get(cache_key, fmt):
+        # Already rendered: point the poller straight at the (cached) export URL
+        query = "&".join(f"{k}={quote(str(v))}" for k, v in form.items())
+        return JSONResponse({
+            "success": True,
+            "job": {"id": None, "format": fmt, "filename": fname, "status": "done",
+                    "download_url": f"/dashboard/export?{query}"},
+        })
+
+    job = export_jobs.submit(fmt, export_sql, params, fname, cache_key=cache_key, db_config=source.config)
+    if job is None:
+        return _export_queue_full()
+    return JSONResponse({"success": True, "job": export_jobs.status(job)}, status_code=202)
+
+@app.get("/dashboard/export/jobs/{job_id}")
+async def export_job_status(job_id: str, request: Request):
+    if not request.session.get("logged_in"):
+        return JSONResponse({"error": "Not logged in"}, status_code=401)
+    job = export_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Export job not found"}, status_code=404)
+    return JSONResponse({"success": True, "job": export_jobs.status(job)})
+
+@app.get("/dashboard/export/jobs/{job_id}/download")
+async def export_job_download(job_id: str, request: Request):
+    if not request.session.get("logged_in"):
+        return RedirectResponse("/dashboard")
+    job = export_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Export job not found"}, status_code=404)
+    if export_jobs.status(job)["status"] != "done":
+        return JSONResponse({"error": "Export is not ready"}, status_code=409)
+    return FileResponse(
+        job["path"],
+        media_type=EXPORT_MEDIA_TYPES[job["format"]],
+        headers={"Content-Disposition": f"attachment; filename={job['filename']}"},
+    )
+
+
+# ==== Maintenance Commands ====
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="NUANU WiFi portal maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="Apply pending schema migrations")
+    commands.add_parser("rebuild-rollups", help="Recompute wifi_users_hourly from wifi_users")
+    commands.add_parser("rebuild-sketches", help="Recompute unique-visitor sketches from wifi_users")
+    commands.add_parser("partition-wifi-users", help="Convert wifi_users to monthly range partitions")
+    commands.add_parser("partition-maintenance", help="Create future partitions and apply retention now")
+    commands.add_parser("search-indexes", help="Create pg_trgm and any missing search indexes")
+    args = parser.parse_args()
 
-    return JSONResponse({"error": "Unsupported format"}, status_code=400)
+    applied = init_db()
+    print(f"Applied migrations: {applied or 'none pending'}")
+    conn = get_connection()
+    try:
+        if args.command == "rebuild-rollups":
+            buckets = rebuild_rollups(conn)
+            print(f"Rebuilt wifi_users_hourly: {buckets} hour/role buckets")
+        elif args.command == "rebuild-sketches":
+            count = rebuild_sketches(conn)
+            print(f"Rebuilt wifi_users_daily_sketches: {count} day/kind sketches")
+        elif args.command == "partition-wifi-users":
+            converted = partition_wifi_users(conn)
+            print("wifi_users converted to monthly partitions" if converted else "wifi_users is already partitioned")
+        elif args.command == "partition-maintenance":
+            print(run_partition_maintenance())
+        elif args.command == "search-indexes":
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                create_search_indexes(cur)
+                print("Search indexes are up to date (trigram email search: %s)" % ("on" if _has_trgm(conn) else "off"))
+        conn.commit()
+    finally:
+        conn.close()
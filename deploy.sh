@@ -72,12 +72,13 @@ echo "🔄 Configuring Supervisor..."
 sudo tee /etc/supervisor/conf.d/nuanu-wifi-portal.conf > /dev/null << 'EOF'
 [program:nuanu-wifi-portal]
 directory=/var/www/nuanu-wifi-portal
-command=/var/www/nuanu-wifi-portal/venv/bin/uvicorn app:app --host 0.0.0.0 --port 8000
+command=/var/www/nuanu-wifi-portal/venv/bin/uvicorn app:app --host 0.0.0.0 --port 8000 --timeout-graceful-shutdown 5
 user=www-data
 autostart=true
 autorestart=true
 stopasgroup=true
 killasgroup=true
+stopwaitsecs=30
 stderr_logfile=/var/log/nuanu-wifi-portal.err.log
 stdout_logfile=/var/log/nuanu-wifi-portal.out.log
 environment=PATH="/var/www/nuanu-wifi-portal/venv/bin"
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Load test and latency benchmark for NUANU WiFi Login Portal
+Runs concurrent scenarios against a running instance and reports throughput
+and p50/p95/p99 latency per endpoint.
+
+Point the app at a throwaway local Postgres, never production, e.g.:
+
+    docker run --rm -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres --name nuanu-pg postgres:16
+    DB_HOST=localhost DB_USER=postgres DB_PASSWORD=postgres DB_NAME=postgres uvicorn app:app --port 8000
+
+Every guest comes from the same client IP, so leave the per-IP rate limit off
+(RATE_LIMIT_PER_SECOND=0, the default) or raise it well above the test rate;
+otherwise the run measures 429s instead of the app. Any 4xx/5xx response,
+including 429 and the 503s from admission control, counts as an error and is
+listed per status code in the report.
+
+Then:
+
+    python load_test.py --scenario all --output results/HEAD.json
+    python load_test.py --scenario all --compare results/HEAD.json   # after a change
+
+Scenarios:
+  burst   captive-portal rush: --guests guests arrive over --duration seconds,
+          each loads the login page and then POSTs /api/save-user
+  admin   --admins staff pages polling /api/users and /api/stats (with ETags)
+  export  a logged-in dashboard download of the full CSV (or --export-format)
+  all     the three above at the same time
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import httpx
+
+ROLES = ["Solopreneur", "Startup Founder", "Established Business Owner", "Educator", "Student", "Investor", "Employee"]
+
+
+def print_header(text):
+    """Print formatted header"""
+    print("\n" + "="*60)
+    print(f"  {text}")
+    print("="*60)
+
+
+class Recorder:
+    """Collects (endpoint, latency, status, bytes) samples for one scenario."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.bytes = Counter()
+        self.errors = Counter()
+        self.started = time.perf_counter()
+        self.finished = None
+
+    async def request(self, client, name, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.errors[name] += 1
+            self.statuses[name][type(e).__name__] += 1
+            return None
+        elapsed = time.perf_counter() - start
+        self.statuses[name][str(response.status_code)] += 1
+        self.bytes[name] += len(response.content)
+        # Fast 429/503 rejections must not pull the latency percentiles down
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        else:
+            self.samples[name].append(elapsed)
+        return response
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def summary(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        endpoints = {}
+        for name in sorted(set(self.samples) | set(self.errors)):
+            endpoints[name] = summarize(self.samples[name], self.errors[name], elapsed)
+            endpoints[name]["statuses"] = dict(self.statuses[name])
+            endpoints[name]["bytes"] = self.bytes[name]
+        every = [s for samples in self.samples.values() for s in samples]
+        overall = summarize(every, sum(self.errors.values()), elapsed)
+        overall["elapsed_s"] = round(elapsed, 3)
+        return {"overall": overall, "endpoints": endpoints}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    to_ms = lambda v: None if v is None else round(v * 1000, 2)
+    return {
+        "requests": len(values) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": to_ms(percentile(values, 50)),
+        "p95_ms": to_ms(percentile(values, 95)),
+        "p99_ms": to_ms(percentile(values, 99)),
+        "max_ms": to_ms(values[-1] if values else None),
+    }
+
+
+# ==== Scenarios ====
+async def guest(client, recorder, delay, n):
+    await asyncio.sleep(delay)
+    await recorder.request(client, "GET /", "GET", "/")
+    await recorder.request(client, "POST /api/save-user", "POST", "/api/save-user", json={
+        "email": f"load-{n}-{random.randrange(10**9)}@example.com",
+        "questions": "load test",
+        "role": random.choice(ROLES),
+    })
+
+
+async def run_burst(args, recorder):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        delays = sorted(random.uniform(0, args.duration) for _ in range(args.guests))
+        await asyncio.gather(*(guest(client, recorder, d, n) for n, d in enumerate(delays)))
+
+
+async def admin_page(args, recorder, stop_at):
+    etags = {}
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+        # Stagger pages so they don't all poll in lockstep
+        await asyncio.sleep(random.uniform(0, args.poll_interval))
+        while time.perf_counter() < stop_at:
+            for name, url in (("GET /api/users", "/api/users?limit=100"), ("GET /api/stats", "/api/stats")):
+                headers = {"If-None-Match": etags[url]} if url in etags else {}
+                response = await recorder.request(client, name, "GET", url, headers=headers)
+                if response is not None and "etag" in response.headers:
+                    etags[url] = response.headers["etag"]
+            await asyncio.sleep(args.poll_interval)
+
+
+async def run_admin(args, recorder):
+    stop_at = time.perf_counter() + args.duration
+    await asyncio.gather(*(admin_page(args, recorder, stop_at) for _ in range(args.admins)))
+
+
+async def run_export(args, recorder):
+    if not args.dashboard_password:
+        print("⚠️  No dashboard password (--dashboard-password / DASHBOARD_PASSWORD), skipping export")
+        return
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.export_timeout) as client:
+        login = await recorder.request(client, "POST /dashboard", "POST", "/dashboard",
+                                       data={"password": args.dashboard_password})
+        if login is None or login.status_code != 200:
+            print(f"⚠️  Dashboard login failed ({login.status_code if login is not None else 'no response'}), skipping export")
+            return
+        params = {"format": args.export_format, "date_filter": args.export_filter}
+        name = f"GET /dashboard/export ({args.export_format})"
+        for _ in range(args.exports):
+            await recorder.request(client, name, "GET", "/dashboard/export", params=params)
+
+
+SCENARIOS = {"burst": run_burst, "admin": run_admin, "export": run_export}
+
+
+async def run_scenarios(args):
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    recorders = {name: Recorder() for name in names}
+
+    async def run_one(name):
+        await SCENARIOS[name](args, recorders[name])
+        recorders[name].finish()
+
+    await asyncio.gather(*(run_one(name) for name in names))
+    return {name: recorder.summary() for name, recorder in recorders.items()}
+
+
+# ==== Reporting ====
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results):
+    for scenario, result in results.items():
+        print_header(f"Scenario: {scenario}")
+        print(f"{'endpoint':<38}{'reqs':>7}{'err':>5}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+        rows = list(result["endpoints"].items()) + [("(overall)", result["overall"])]
+        for name, s in rows:
+            fmt = lambda v: "-" if v is None else f"{v:.1f}"
+            print(f"{name[:37]:<38}{s['requests']:>7}{s['errors']:>5}{s['throughput_rps']:>9.1f}"
+                  f"{fmt(s['p50_ms']):>9}{fmt(s['p95_ms']):>9}{fmt(s['p99_ms']):>9}")
+            failed = {code: n for code, n in s.get("statuses", {}).items() if not code.isdigit() or int(code) >= 400}
+            if failed:
+                print("  ⚠️  errors: " + ", ".join(f"{code} x{n}" for code, n in sorted(failed.items())))
+    print("\nLatencies in ms.")
+
+
+def error_rate(s):
+    return s["errors"] / s["requests"] if s["requests"] else 0.0
+
+
+def compare(results, baseline, threshold):
+    """Print p95/error-rate/throughput deltas against a saved run; returns False on a regression.
+
+    p95 and throughput regress when they are more than `threshold` (relative)
+    worse. The error rate regresses when it grows by more than `threshold` of
+    the baseline rate and by at least 0.1 percentage points, so shedding load
+    faster can't pass as a latency win.
+    """
+    print_header(f"Compared with {baseline['meta'].get('commit') or 'baseline'}")
+    ok = True
+    for scenario, result in results.items():
+        base_endpoints = baseline["results"].get(scenario, {}).get("endpoints", {})
+        for name, s in result["endpoints"].items():
+            base = base_endpoints.get(name)
+            if not base:
+                continue
+            problems = []
+            if base.get("p95_ms") and s["p95_ms"] is not None:
+                if (s["p95_ms"] - base["p95_ms"]) / base["p95_ms"] > threshold:
+                    problems.append("p95")
+            base_errors, errors = error_rate(base), error_rate(s)
+            if errors - base_errors > max(base_errors * threshold, 0.001):
+                problems.append("errors")
+            if base["throughput_rps"] and (base["throughput_rps"] - s["throughput_rps"]) / base["throughput_rps"] > threshold:
+                problems.append("rps")
+            ok = ok and not problems
+            marker = "❌" if problems else "✅"
+            print(f"{marker} {scenario}/{name}: p95 {base['p95_ms']} → {s['p95_ms']} ms, "
+                  f"errors {base_errors:.1%} → {errors:.1%}, rps {base['throughput_rps']} → {s['throughput_rps']}"
+                  + (f"  ({', '.join(problems)} regressed)" if problems else ""))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the NUANU WiFi portal")
+    parser.add_argument("--base-url", default=os.getenv("LOAD_TEST_URL", "http://localhost:8000"))
+    parser.add_argument("--scenario", choices=["burst", "admin", "export", "all"], default="all")
+    parser.add_argument("--guests", type=int, default=500, help="guests in the burst scenario")
+    parser.add_argument("--duration", type=float, default=60, help="seconds the burst / admin polling lasts")
+    parser.add_argument("--concurrency", type=int, default=100, help="max open connections for the burst")
+    parser.add_argument("--admins", type=int, default=10, help="admin pages polling at once")
+    parser.add_argument("--poll-interval", type=float, default=5)
+    parser.add_argument("--exports", type=int, default=1, help="sequential export downloads")
+    parser.add_argument("--export-format", choices=["csv", "xlsx", "pdf"], default="csv")
+    parser.add_argument("--export-filter", default="", help="date_filter for the export, e.g. last30")
+    parser.add_argument("--dashboard-password", default=os.getenv("DASHBOARD_PASSWORD"),
+                        help="needed for the export scenario (defaults to $DASHBOARD_PASSWORD)")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--export-timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed p95/error-rate/throughput regression (0.10 = 10%%)")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    print(f"Target: {args.base_url}  Scenario: {args.scenario}  Time: {datetime.now():%Y-%m-%d %H:%M:%S}")
+    results = asyncio.run(run_scenarios(args))
+    print_report(results)
+
+    run = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "base_url": args.base_url,
+            "args": {k: v for k, v in vars(args).items() if k not in ("dashboard_password", "output", "compare")},
+        },
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.threshold):
+            print("\n⚠️  Regression above threshold")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n\n⚠️  Load test interrupted by user")
+        sys.exit(1)
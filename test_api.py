@@ -6,11 +6,13 @@ Run this to verify all endpoints work correctly
 
 import requests
 import json
+import os
 from datetime import datetime
 
 # Configuration
 BASE_URL = "http://localhost:8000"  # Change to your Railway URL for production testing
 TEST_EMAIL = f"test-{datetime.now().strftime('%Y%m%d%H%M%S')}@example.com"
+SKIPPED = "skipped"  # Returned by tests whose prerequisites are not configured
 
 def print_header(text):
     """Print formatted header"""
@@ -23,6 +25,10 @@ def print_result(success, message):
     status = "✅ PASS" if success else "❌ FAIL"
     print(f"{status}: {message}")
 
+def print_skip(message):
+    """Print a skipped test"""
+    print(f"⏭️  SKIP: {message}")
+
 def test_home_page():
     """Test if home page loads"""
     print_header("Test 1: Home Page")
@@ -85,6 +91,50 @@ def test_get_users():
         print_result(False, f"Error: {str(e)}")
         return False
 
+def test_users_pagination():
+    """Test cursor pagination on the users list"""
+    print_header("Test 4b: Users Pagination")
+    try:
+        first = requests.get(f"{BASE_URL}/api/users", params={"limit": 1}).json()
+        if not first.get("success"):
+            print_result(False, "Failed to get first page")
+            return False
+        cursor = first.get("next_cursor")
+        if not cursor:
+            print_result(True, f"Only {first.get('count', 0)} user(s), nothing to page through")
+            return True
+        second = requests.get(f"{BASE_URL}/api/users", params={"limit": 1, "cursor": cursor}).json()
+        success = (
+            second.get("success") == True
+            and second.get("count") == 1
+            and second["data"][0]["id"] != first["data"][0]["id"]
+        )
+        print_result(success, f"Page 2 starts at user {second.get('data', [{}])[0].get('id')}")
+        return success
+    except Exception as e:
+        print_result(False, f"Error: {str(e)}")
+        return False
+
+def test_search_users():
+    """Test server-side search finds the test user by an email fragment"""
+    print_header("Test 4c: Search Users")
+    try:
+        # A fragment from the middle of the address: the timestamp in test-<timestamp>@example.com
+        fragment = TEST_EMAIL.split("-")[1].split("@")[0]
+        response = requests.get(f"{BASE_URL}/api/users/search", params={"q": fragment, "limit": 100})
+        data = response.json()
+        emails = [user["email"] for user in data.get("data", [])]
+        success = response.status_code == 200 and TEST_EMAIL in emails
+        if success:
+            match = data["data"][emails.index(TEST_EMAIL)]
+            print_result(True, f"{data['count']} result(s); highlighted: {match['email_html']}")
+        else:
+            print_result(False, f"Test user not in results for '{fragment}': {data.get('message', emails[:5])}")
+        return success
+    except Exception as e:
+        print_result(False, f"Error: {str(e)}")
+        return False
+
 def test_get_stats():
     """Test getting statistics"""
     print_header("Test 5: Get Statistics")
@@ -169,6 +219,244 @@ def test_database_connection():
         print_result(False, f"Error: {str(e)}")
         return False
 
+def test_xlsx_export_memory(rows=20000, limit_mb=5):
+    """Test that the XLSX writer keeps peak memory flat (runs in-process, no server needed)"""
+    print_header("Test 8: XLSX Export Peak Memory")
+    try:
+        import tempfile
+        import tracemalloc
+        from app import _write_xlsx
+
+        def batches():
+            created_at = datetime(2024, 1, 1)
+            for start in range(0, rows, 1000):
+                yield [(f"user{i}@example.com", created_at) for i in range(start, start + 1000)]
+
+        tracemalloc.start()
+        with tempfile.TemporaryFile() as f:
+            _write_xlsx(f, batches())
+            size = f.tell()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+
+        success = size > 0 and peak_mb < limit_mb
+        print_result(success, f"{rows} rows -> {size} bytes, peak {peak_mb:.2f} MB (limit {limit_mb} MB)")
+        return success
+    except Exception as e:
+        print_result(False, f"Error: {str(e)}")
+        return False
+
+def test_unique_visitor_sketch(days=30, visits_per_day=3000, guests=20000):
+    """Test HyperLogLog unique-visitor estimates against the exact count (in-process, no server needed)"""
+    print_header("Test 9: Unique Visitor Sketch Accuracy")
+    try:
+        import random
+        from app import HyperLogLog, HLL_STANDARD_ERROR
+
+        rng = random.Random(42)
+        daily = []
+        exact = set()
+        for _ in range(days):
+            sketch = HyperLogLog()
+            for _ in range(visits_per_day):
+                # Returning guests: the same emails show up again on other days
+                email = f"guest{rng.randrange(guests)}@example.com"
+                sketch.add(email)
+                exact.add(email)
+            daily.append(HyperLogLog.from_bytes(sketch.to_bytes()))
+
+        merged = HyperLogLog()
+        for sketch in daily:
+            merged.merge(sketch)
+        estimate = merged.count()
+        error = abs(estimate - len(exact)) / len(exact)
+
+        success = error <= 3 * HLL_STANDARD_ERROR
+        print_result(success, f"exact {len(exact)}, estimate {estimate}, error {error:.2%} (bound {3 * HLL_STANDARD_ERROR:.2%})")
+        return success
+    except Exception as e:
+        print_result(False, f"Error: {str(e)}")
+        return False
+
+def test_oidc_prewarm():
+    """Test OIDC metadata prewarm and disk cache against a local stand-in discovery server (in-process)"""
+    print_header("Test 10: OIDC Metadata Prewarm")
+    try:
+        import asyncio
+        import tempfile
+        import threading
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        from pathlib import Path
+        from authlib.integrations.starlette_client import OAuth
+        from app import load_oidc_metadata
+
+        hits = []
+
+        class DiscoveryHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                hits.append(self.path)
+                base = f"http://127.0.0.1:{self.server.server_port}"
+                if self.path == "/.well-known/openid-configuration":
+                    body = {"issuer": base, "jwks_uri": f"{base}/certs"}
+                elif self.path == "/certs":
+                    body = {"keys": [{"kty": "RSA", "kid": "test", "n": "AQAB", "e": "AQAB"}]}
+                else:
+                    self.send_error(404)
+                    return
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), DiscoveryHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        discovery_url = f"http://127.0.0.1:{server.server_port}/.well-known/openid-configuration"
+
+        def new_client():
+            oauth = OAuth()
+            return oauth.register(name="stand_in", client_id="x", client_secret="y", server_metadata_url=discovery_url)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_file = Path(tmp) / "oidc.json"
+            first = new_client()
+            asyncio.run(load_oidc_metadata(first, discovery_url, cache_file))
+            fetched = len(hits)
+            server.shutdown()
+
+            # Server gone: a fresh client is served from the disk cache, and
+            # authlib's own lookups on the login path don't touch the network.
+            second = new_client()
+            asyncio.run(load_oidc_metadata(second, discovery_url, cache_file))
+            jwks = asyncio.run(second.fetch_jwk_set())
+
+        success = fetched == 2 and len(hits) == 2 and jwks["keys"][0]["kid"] == "test"
+        print_result(success, f"{fetched} fetches at startup, {len(hits) - fetched} after restart (served from cache)")
+        return success
+    except Exception as e:
+        print_result(False, f"Error: {str(e)}")
+        return False
+
+def test_replica_routing():
+    """Test read routing between two local Postgres instances (in-process, set TEST_PRIMARY_DSN / TEST_REPLICA_DSN)"""
+    print_header("Test 11: Read Replica Routing")
+    primary_dsn, replica_dsn = os.getenv("TEST_PRIMARY_DSN"), os.getenv("TEST_REPLICA_DSN")
+    if not (primary_dsn and replica_dsn):
+        print_skip("TEST_PRIMARY_DSN and TEST_REPLICA_DSN are not set")
+        return SKIPPED
+    try:
+        import asyncio
+        import time
+        from psycopg2.extensions import parse_dsn
+        from app import DBPool, ReadRouter
+
+        primary = DBPool(parse_dsn(primary_dsn), 0, 2, 5)
+        replica = DBPool(parse_dsn(replica_dsn), 0, 2, 5)
+        dead = DBPool({**parse_dsn(replica_dsn), "host": "127.0.0.1", "port": 1, "connect_timeout": 2}, 0, 2, 5)
+        probe = "SELECT name FROM replica_routing_probe"
+
+        def label(conn, name):
+            with conn.cursor() as cur:
+                cur.execute("DROP TABLE IF EXISTS replica_routing_probe")
+                cur.execute("CREATE TABLE replica_routing_probe (name TEXT)")
+                cur.execute("INSERT INTO replica_routing_probe VALUES (%s)", (name,))
+
+        def drop(conn):
+            with conn.cursor() as cur:
+                cur.execute("DROP TABLE IF EXISTS replica_routing_probe")
+
+        async def scenario():
+            await primary.run(label, "primary")
+            await replica.run(label, "replica")
+            router = ReadRouter(primary, replica)
+            try:
+                within = (await router.fetchone(30, probe))[0]
+                pinned = (await router.fetchone(0, probe))[0]
+                # Pretend the replica fell 100s behind (and was just measured)
+                router.lag, router._checked_at = 100.0, time.monotonic()
+                lagging = (await router.fetchone(30, probe))[0]
+                down = ReadRouter(primary, dead)
+                down.open()
+                unreachable = (await down.fetchone(30, probe))[0]
+                return within, pinned, lagging, unreachable, down.stats()["available"]
+            finally:
+                await primary.run(drop)
+                await replica.run(drop)
+
+        primary.open()
+        replica.open()
+        try:
+            within, pinned, lagging, unreachable, dead_available = asyncio.run(scenario())
+        finally:
+            primary.close()
+            replica.close()
+            dead.close()
+
+        success = (within, pinned, lagging, unreachable, dead_available) == (
+            "replica", "primary", "primary", "primary", False
+        )
+        print_result(success, f"in budget → {within}, pinned → {pinned}, lagging → {lagging}, "
+                              f"replica down → {unreachable}")
+        return success
+    except Exception as e:
+        print_result(False, f"Error: {str(e)}")
+        return False
+
+def test_partition_conversion():
+    """Test partition-wifi-users on the stock schema (in-process, set TEST_DATABASE_DSN to a throwaway database)"""
+    print_header("Test 12: wifi_users Partition Conversion")
+    dsn = os.getenv("TEST_DATABASE_DSN")
+    if not dsn:
+        print_skip("TEST_DATABASE_DSN is not set")
+        return SKIPPED
+    try:
+        import psycopg2
+        from app import run_migrations, partition_wifi_users
+
+        schema = f"partition_test_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        cur = conn.cursor()
+        try:
+            # Everything below resolves wifi_users & co. to the scratch schema
+            cur.execute(f"CREATE SCHEMA {schema}")
+            cur.execute(f"SET search_path TO {schema}, public")
+            run_migrations(conn)
+            cur.execute("""
+                INSERT INTO wifi_users (email, role, created_at) VALUES
+                    ('old@example.com', 'Student', NOW() - INTERVAL '2 months'),
+                    ('recent@example.com', 'Investor', NOW()),
+                    ('undated@example.com', 'Educator', NULL)
+            """)
+            converted = partition_wifi_users(conn)
+            cur.execute("SELECT count(*) FROM wifi_users")
+            rows = cur.fetchone()[0]
+            cur.execute("""
+                SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'wifi_users'::regclass AND c.relname = 'wifi_users_legacy'
+            """)
+            attached = cur.fetchone() is not None
+            # Inserts through the new parent still draw ids from the old sequence
+            cur.execute("INSERT INTO wifi_users (email) VALUES ('after@example.com') RETURNING id")
+            new_id = cur.fetchone()[0]
+            again = partition_wifi_users(conn)
+        finally:
+            cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            cur.close()
+            conn.close()
+
+        success = converted and rows == 3 and attached and new_id > 3 and not again
+        print_result(success, f"converted: {converted}, rows kept: {rows}/3, legacy attached: {attached}, "
+                              f"new id: {new_id}, second run no-op: {not again}")
+        return success
+    except Exception as e:
+        print_result(False, f"Error: {str(e)}")
+        return False
+
 def run_all_tests():
     """Run all tests"""
     print("\n" + "🧪 " + "="*58)
@@ -189,19 +477,27 @@ def run_all_tests():
     results.append(("Save User", save_success))
     
     results.append(("Get Users", test_get_users()))
+    results.append(("Users Pagination", test_users_pagination()))
+    results.append(("Search Users", test_search_users()))
     results.append(("Get Statistics", test_get_stats()))
     results.append(("Delete User", test_delete_user(user_id)))
     results.append(("Database Connection", test_database_connection()))
+    results.append(("XLSX Export Memory", test_xlsx_export_memory()))
+    results.append(("Unique Visitor Sketch", test_unique_visitor_sketch()))
+    results.append(("OIDC Metadata Prewarm", test_oidc_prewarm()))
+    results.append(("Read Replica Routing", test_replica_routing()))
+    results.append(("Partition Conversion", test_partition_conversion()))
     
     # Summary
     print_header("Test Summary")
-    passed = sum(1 for _, result in results if result)
-    total = len(results)
+    skipped = sum(1 for _, result in results if result == SKIPPED)
+    passed = sum(1 for _, result in results if result and result != SKIPPED)
+    total = len(results) - skipped
     
-    print(f"\nResults: {passed}/{total} tests passed\n")
+    print(f"\nResults: {passed}/{total} tests passed, {skipped} skipped\n")
     
     for test_name, result in results:
-        status = "✅ PASS" if result else "❌ FAIL"
+        status = "⏭️  SKIP" if result == SKIPPED else "✅ PASS" if result else "❌ FAIL"
         print(f"  {status}  {test_name}")
     
     print("\n" + "="*60)